@@ -9,12 +9,17 @@ from openai import OpenAI
 import asyncio
 import time
 
-import tempfile
-
 # Importa o módulo agents
 from audio_agent import transcribe_via_agent
 from audio_agent import analyze_image_via_agent
-from myagents import process_llm
+from myagents import process_llm, conversation_history
+from metrics import metrics
+from work_queue import ChatWorkQueue
+from runtime import runtime
+from waha_client import waha, MediaTooLarge, MEDIA_MAX_BYTES
+from history_store import append_record
+from cache import RecentIds
+from rate_limit import AdmissionControl
 
 
 load_dotenv()
@@ -30,37 +35,15 @@ LOG_FOLDER = "logs"
 if not os.path.exists(LOG_FOLDER):
     os.makedirs(LOG_FOLDER)
 
-# Funções de envio
+# Funções de envio (cliente WAHA com pool de conexões, timeouts e retries)
 def send_message(chat_id, text):
-    r = requests.post("http://localhost:3000/api/sendText", json={
-        "chatId": chat_id,
-        "text": text,
-        "session": "default",
-    })
-    r.raise_for_status()
+    waha.send_text(chat_id, text)
 
 def send_message_quote(chat_id, text, message_id=None):
-    r = requests.post("http://localhost:3000/api/sendText", json={
-        "chatId": chat_id,
-        "text": text,
-        "session": "default",
-        "quotedMessageId": message_id,
-    })
-    r.raise_for_status()
+    waha.send_text(chat_id, text, quoted_message_id=message_id)
 
 def send_seen(chat_id, message_id, participant):
-    r = requests.post("http://localhost:3000/api/sendSeen", json={
-        "session": "default",
-        "chatId": chat_id,
-        "messageId": message_id,
-        "participant": participant,
-    })
-    r.raise_for_status()
-
-def typing(chat_id, seconds):
-    requests.post("http://localhost:3000/api/startTyping", json={"session": "default", "chatId": chat_id})
-    time.sleep(seconds)
-    requests.post("http://localhost:3000/api/stopTyping", json={"session": "default", "chatId": chat_id})
+    waha.send_seen(chat_id, message_id, participant)
 
 # Gerenciamento de contatos permitidos
 def load_allowed_contacts():
@@ -90,7 +73,12 @@ allowed_contacts = load_allowed_contacts()
 
 # Gerenciamento de configuração
 def load_config():
-    config = {"enable_responses": "true", "enable_group_responses": "true"}
+    config = {"enable_responses": "true", "enable_group_responses": "true", "async_ingestion": "false",
+              "coalesce_window": "0",
+              # limites de taxa (mensagens por minuto; 0 = sem limite) e política acima do limite
+              "rate_contact_per_min": "0", "rate_group_per_min": "0", "rate_global_per_min": "0",
+              "rate_burst": "3", "rate_policy": "queue", "rate_max_wait": "60",
+              "rate_reply_text": "Muitas mensagens agora, respondo em breve."}
     if os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE) as f:
             for line in f:
@@ -106,6 +94,23 @@ def save_config(config):
 
 config = load_config()
 
+def configurar_limites(admission_control=None):
+    """Cria (ou reconfigura) o controle de admissão a partir do config."""
+    params = dict(
+        contact_rpm=float(config.get("rate_contact_per_min", "0")),
+        group_rpm=float(config.get("rate_group_per_min", "0")),
+        global_rpm=float(config.get("rate_global_per_min", "0")),
+        burst=int(config.get("rate_burst", "3")),
+        policy=config.get("rate_policy", "queue"),
+        max_wait=float(config.get("rate_max_wait", "60")),
+    )
+    if admission_control is None:
+        return AdmissionControl(**params)
+    admission_control.configure(**params)
+    return admission_control
+
+admission = configurar_limites()
+
 def get_log_filename(contact: str) -> str:
     return os.path.join(LOG_FOLDER, f"messages_{contact}.log")
 
@@ -118,6 +123,27 @@ def index():
         config["enable_responses"] = "true" if request.form.get("enable_responses") == "on" else "false"
         # group responses
         config["enable_group_responses"] = "true" if request.form.get("enable_group_responses") == "on" else "false"
+        # ingestão assíncrona (fila por chat)
+        config["async_ingestion"] = "true" if request.form.get("async_ingestion") == "on" else "false"
+        # janela de coalescência (segundos; 0 desativa)
+        try:
+            coalesce_window = max(0.0, float(request.form.get("coalesce_window", "0") or 0))
+        except ValueError:
+            coalesce_window = 0.0
+        config["coalesce_window"] = str(coalesce_window)
+        if work_queue is not None:
+            work_queue.coalesce_window = coalesce_window
+        # limites de taxa
+        for key in ("rate_contact_per_min", "rate_group_per_min", "rate_global_per_min", "rate_burst", "rate_max_wait"):
+            try:
+                config[key] = str(max(0, float(request.form.get(key, config.get(key, "0")) or 0)))
+            except ValueError:
+                pass
+        config["rate_burst"] = str(max(1, int(float(config["rate_burst"]))))
+        if request.form.get("rate_policy") in ("queue", "shed", "reply"):
+            config["rate_policy"] = request.form["rate_policy"]
+        config["rate_reply_text"] = request.form.get("rate_reply_text", config.get("rate_reply_text", "")).strip()
+        configurar_limites(admission)
         # contatos
         for c in allowed_contacts:
             c["enabled"] = request.form.get(f"enabled_{c['contact']}") == "on"
@@ -156,8 +182,19 @@ def index():
                            message=msg,
                            log_sent_content=log_sent_content)
 
-# Cache de mensagens processadas
-mensagens_processadas = set()
+# Métricas de latência (spawn/empréstimo do pool MCP, etc.)
+@app.route("/stats", methods=["GET"])
+def stats():
+    snapshot = metrics.snapshot()
+    snapshot["conversation_cache"] = conversation_history.stats()
+    snapshot["dedup"] = mensagens_processadas.stats()
+    snapshot["rate_limit"] = admission.stats()
+    if work_queue is not None:
+        snapshot["queue"] = work_queue.stats()
+    return jsonify(snapshot)
+
+# Cache de mensagens processadas (tamanho fixo, só IDs recentes)
+mensagens_processadas = RecentIds()
 
 # Webhook
 @app.route("/webhook", methods=["POST"])
@@ -179,9 +216,8 @@ def webhook():
 
 
     # evita duplicatas
-    if message_id in mensagens_processadas:
+    if mensagens_processadas.check_and_add(message_id):
         return jsonify({"status":"ignorado","motivo":"mensagem duplicada"}),200
-    mensagens_processadas.add(message_id)
 
     # ignora mensagens do bot
     if texto.startswith("🤖:"):
@@ -225,76 +261,170 @@ def webhook():
 
     print(f"Recebido de {from_name}: {texto}, participant: {participant}, is_group: {is_group}")
 
-    # Verificar se tem midia e se deve responder apenas para autorizado
-    if payload.get("hasMedia") and devo_responder:
-        media_info = payload.get("media") or {}
-        mimetype = media_info.get("mimetype", "")
-        media_url = media_info.get("url")
+    evento = {
+        "chat_id": chat_id,
+        "participant": participant,
+        "message_id": message_id,
+        "texto": texto,
+        "from_name": from_name,
+        "msg_type": msg_type,
+        "remetente": remetente,
+        "has_media": bool(payload.get("hasMedia")),
+        "media": payload.get("media") or {},
+        "devo_responder": devo_responder,
+        "log_entry": log_entry,
+    }
 
-        print(mimetype)
-        subtype = mimetype.split("/")[1].split(";")[0]  # -> "ogg"
-        suffix = f".{subtype}"                         # -> ".ogg"
+    # Controle de admissão: limites por contato, por grupo e global
+    if devo_responder:
+        decisao, atraso = admission.admit(remetente, chat_id, is_group)
+        if decisao in ("shed", "reply"):
+            if decisao == "reply" and config.get("rate_reply_text"):
+                runtime.submit(waha.asend_text(chat_id, f"🤖: {config['rate_reply_text']}"))
+            append_record(get_log_filename(remetente), log_entry)
+            # 200: o WAHA trata não-2xx como falha de entrega e reenviaria a mensagem descartada
+            return jsonify({"status":"ignorado","motivo":"limite de taxa"}),200
+        if atraso:
+            evento["liberar_em"] = time.monotonic() + atraso
+
+    # Modo de ingestão assíncrona: confirma o webhook na hora e processa em background
+    if devo_responder and config.get("async_ingestion") == "true":
+        if not get_work_queue().submit(chat_id, evento):
+            # não aceita: a retentativa do WAHA não pode cair no dedup nem pagar o limite de taxa de novo
+            mensagens_processadas.discard(message_id)
+            admission.refund(remetente, chat_id, is_group)
+            return jsonify({"status":"rejeitado","motivo":"fila cheia"}),503
+        return jsonify({"status":"enfileirado"}),202
+
+    # Executa no event loop compartilhado (conexões e sessões MCP persistem entre mensagens)
+    resposta = runtime.run(processar_evento(evento))
+    if resposta is None:
+        return jsonify({"status":"ok","message":"falha no download de mídia"}), 200
 
-        try:
-            resp = requests.get(media_url)
-            resp.raise_for_status()
-            media_bytes = resp.content
-        except requests.exceptions.HTTPError as e:
-            print(f"Falha ao baixar mídia: {e}")
-            return jsonify({"status":"ok","message":"falha no download de mídia"}), 200
-        else:
-            # 2) Se for voz (ptt ou audio), transcreve
-            if msg_type in ("ptt", "audio"):
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-                tmp.write(media_bytes)
-                tmp_path = tmp.name
-                tmp.close()
-
-                print(f"Transcrevendo áudio de {chat_id} ({message_id})...")
-
-                # Transcreve: lê bytes e envia ao Agent
-                with open(tmp_path, "rb") as f:
-                    audio_bytes = f.read()
-
-                texto = transcribe_via_agent(audio_bytes)
-                print(f"Transcrição concluída: {texto}")
-
-                os.unlink(tmp_path)
-            
-            if msg_type in ("image", "video", "document"):
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-                tmp.write(media_bytes)
-                tmp_path = tmp.name
-                tmp.close()
-
-                print(f"Analisando imagem de {chat_id} ({message_id})...")
-
-                # Análise de imagem: lê bytes e envia ao Agent
-                with open(tmp_path, "rb") as f:
-                    image_bytes = f.read()
-
-                texto = analyze_image_via_agent(image_bytes)
-                print(f"Análise concluída: {texto}")
-
-                os.unlink(tmp_path)
+    return jsonify({"status":"ok","resposta": resposta}),200
 
-    if devo_responder:
-        send_seen(chat_id=chat_id, message_id=message_id, participant=participant)
-        typing(chat_id, 2)
-        resposta = asyncio.run(process_llm(texto, from_name, remetente))
-        send_message(chat_id=chat_id, text=f"🤖: {resposta}")
-        log_entry["assistant_response"] = resposta
+# Download e processamento de mídia (bloqueante)
+def processar_midia(evento):
+    """Baixa a mídia e retorna o texto (transcrição/análise), ou None se o download falhar."""
+    chat_id    = evento["chat_id"]
+    message_id = evento["message_id"]
+    msg_type   = evento["msg_type"]
+    texto      = evento["texto"]
+
+    media_info = evento["media"]
+    mimetype = media_info.get("mimetype", "")
+    media_url = media_info.get("url")
+
+    print(mimetype)
+    subtype = mimetype.split("/")[1].split(";")[0]  # -> "ogg"
+    suffix = f".{subtype}"                         # -> ".ogg"
+
+    # Baixa em streaming para a memória, com limite de tamanho (sem arquivos temporários)
+    try:
+        media = waha.fetch_media(media_url, max_bytes=int(config.get("media_max_bytes", MEDIA_MAX_BYTES)))
+    except (requests.exceptions.RequestException, MediaTooLarge) as e:
+        print(f"Falha ao baixar mídia: {e}")
+        return None
+
+    # 2) Se for voz (ptt ou audio), transcreve
+    if msg_type in ("ptt", "audio"):
+        print(f"Transcrevendo áudio de {chat_id} ({message_id})...")
+        texto = transcribe_via_agent(media, filename=f"audio{suffix}")
+        print(f"Transcrição concluída: {texto}")
+
+    if msg_type in ("image", "video", "document"):
+        print(f"Analisando imagem de {chat_id} ({message_id})...")
+        texto = analyze_image_via_agent(media, msg_type=msg_type)
+        print(f"Análise concluída: {texto}")
+
+    return texto
+
+def mesclar_eventos(eventos):
+    """Junta mensagens seguidas do mesmo chat em um único evento (modo coalescência)."""
+    return {**eventos[-1], "partes": eventos, "irreversivel": False}
+
+async def processar_evento(evento):
+    """
+    Executa as etapas de resposta de uma mensagem aceita pelo webhook:
+    seen -> (typing durante mídia + LLM + envio) -> log.
+    Com coalescência, evento["partes"] traz as mensagens mescladas: viram um único texto,
+    uma única chamada do agente e um registro de log por mensagem.
+    Retorna a resposta enviada ("" se não deve responder) ou None se a mídia falhar.
+    Cada etapa registra sua latência em metrics (stage.*).
+    """
+    chat_id     = evento["chat_id"]
+    remetente   = evento["remetente"]
+    from_name   = evento["from_name"]
+    partes      = evento.get("partes") or [evento]
+
+    # acima do limite de taxa com política "queue": espera o token reservado
+    atraso = evento.get("liberar_em", 0) - time.monotonic()
+    if atraso > 0:
+        await asyncio.sleep(atraso)
+
+    if evento["devo_responder"]:
+        # recibo de leitura sai em background, sem segurar a resposta
+        waha.background(waha.asend_seen(chat_id, evento["message_id"], evento["participant"]))
+
+        # "digitando..." fica ativo durante mídia + LLM + envio, sem atraso fixo
+        async with waha.typing(chat_id):
+            textos = []
+            for parte in partes:
+                # Verificar se tem midia e se deve responder apenas para autorizado
+                if parte["has_media"]:
+                    # guardado na parte: se a geração for cancelada, a mídia não é baixada de novo
+                    if "texto_midia" not in parte:
+                        with metrics.timed("stage.media"):
+                            parte["texto_midia"] = await asyncio.to_thread(processar_midia, parte)
+                    if parte["texto_midia"] is not None:
+                        textos.append(parte["texto_midia"])
+                else:
+                    textos.append(parte["texto"])
+            if not textos:
+                return None
+            texto = "\n".join(t for t in textos if t)
+            def marcar_irreversivel():
+                # o agente começou a enviar/alterar algo: refazer a geração duplicaria o efeito
+                evento["irreversivel"] = True
+
+            with metrics.timed("stage.llm"):
+                resposta = await process_llm(texto, from_name, remetente, on_side_effect=marcar_irreversivel)
+            # a partir daqui a resposta não é mais cancelada por mensagens novas
+            evento["irreversivel"] = True
+            with metrics.timed("stage.send"):
+                await waha.asend_text(chat_id, f"🤖: {resposta}")
     else:
         resposta = ""
-        log_entry["assistant_response"] = resposta
 
-    # grava no log por contato
-    with open(get_log_filename(remetente), "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    # grava no log por contato (com rotação por tamanho); a resposta vai na última mensagem
+    for parte in partes:
+        parte["log_entry"]["assistant_response"] = resposta if parte is partes[-1] else ""
+        append_record(get_log_filename(remetente), parte["log_entry"])
 
     print(f"Resposta enviada: {resposta}")
 
-    return jsonify({"status":"ok","resposta": resposta}),200
+    return resposta
+
+# Fila de trabalho por chat (modo async_ingestion), criada sob demanda
+work_queue = None
+
+def get_work_queue():
+    global work_queue
+    if work_queue is None:
+        work_queue = ChatWorkQueue(
+            processar_evento,
+            maxsize=int(config.get("queue_maxsize", "100")),
+            workers=int(config.get("queue_workers", "4")),
+            coalesce_window=float(config.get("coalesce_window", "0")),
+            merge=mesclar_eventos,
+        )
+        work_queue.start()
+    return work_queue
+
+# Ingestão contínua dos logs de conversa no second brain (opcional, brain_ingest=true)
+if config.get("brain_ingest") == "true":
+    from log_ingester import LogIngester
+    runtime.submit(LogIngester(LOG_FOLDER).run())
 
 if __name__ == "__main__":
     app.run(host="192.168.0.22", port=5000)
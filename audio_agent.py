@@ -1,76 +1,105 @@
 # audio_agent.py
 
 import os
-import tempfile
+import io
 import base64
 from dotenv import load_dotenv
+
+# carrega sua chave (e as configurações de mídia: media_cache/media_prep leem o ambiente no import)
+load_dotenv()
+
 from openai import OpenAI
 from agents import function_tool
 
-# carrega sua chave
-load_dotenv()
+from media_cache import get_media_cache
+from media_prep import IMAGE_FORMAT, IMAGE_MAX_EDGE, VIDEO_KEYFRAMES, prepare_media
+from metrics import metrics
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # --- transcrição de áudio existente ---
 
-def _whisper_transcribe_raw(audio_bytes: bytes) -> str:
-    with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as tmp:
-        tmp.write(audio_bytes)
-        path = tmp.name
-    try:
-        with open(path, "rb") as f:
-            resp = client.audio.transcriptions.create(
-                file=f,
-                model="gpt-4o-mini-transcribe",
-                temperature=0.0,
-                language="pt"
-            )
-        return resp.text.strip()
-    finally:
-        os.remove(path)
+def _as_buffer(data):
+    # io.BytesIO -> memoryview do buffer interno (sem cópia); bytes passam direto
+    if isinstance(data, io.BytesIO):
+        return data.getbuffer()
+    return data
+
+def _whisper_transcribe_raw(audio_bytes, filename: str = "audio.ogg") -> str:
+    # envia direto da memória (bytes ou io.BytesIO); o nome do arquivo define o formato para a API
+    resp = client.audio.transcriptions.create(
+        file=(filename, audio_bytes),
+        model="gpt-4o-mini-transcribe",
+        temperature=0.0,
+        language="pt"
+    )
+    return resp.text.strip()
 
 @function_tool
 def whisper_transcribe(audio_bytes: bytes) -> str:
     return _whisper_transcribe_raw(audio_bytes)
 
-def transcribe_via_agent(path_or_bytes) -> str:
+def transcribe_via_agent(path_or_bytes, filename: str = "audio.ogg") -> str:
     if isinstance(path_or_bytes, str):
         with open(path_or_bytes, "rb") as f:
             audio_bytes = f.read()
+        filename = os.path.basename(path_or_bytes)
     else:
         audio_bytes = path_or_bytes
-    return _whisper_transcribe_raw(audio_bytes)
+    # áudio encaminhado (mesmos bytes) reaproveita a transcrição em cache
+    return get_media_cache().cached(
+        "transcript", _as_buffer(audio_bytes),
+        lambda: _whisper_transcribe_raw(audio_bytes, filename),
+    )
 
 
 # --- nova ferramenta: enviar imagem para o LLM ---
 
-def analyze_image_via_agent(path_or_bytes) -> str:
+def analyze_image_via_agent(path_or_bytes, msg_type: str = "image") -> str:
     """
     Mantém a assinatura existente:
-    - aceita str (caminho) ou bytes.
+    - aceita str (caminho), bytes ou buffer em memória (io.BytesIO).
     Envia ao gpt-4.1-mini usando o array de conteúdo multimodal com image_url.
+    A imagem é reduzida/recodificada antes do envio; vídeos viram alguns keyframes.
     """
     # carrega bytes
     if isinstance(path_or_bytes, str):
         with open(path_or_bytes, "rb") as f:
             image_bytes = f.read()
     else:
-        image_bytes = path_or_bytes
+        image_bytes = _as_buffer(path_or_bytes)
 
-    # codifica como data URI base64 (tipo ajustável conforme seu mimetype)
-    import base64
-    b64 = base64.b64encode(image_bytes).decode()
-    data_uri = f"data:image/jpeg;base64,{b64}"
+    # imagem encaminhada (mesmos bytes) reaproveita a descrição em cache; tipo e configuração
+    # do pré-processamento entram na chave (outro recorte/nº de quadros => outra descrição)
+    kind = f"image:{msg_type}:{IMAGE_MAX_EDGE}:{IMAGE_FORMAT}:{VIDEO_KEYFRAMES}"
+    description = get_media_cache().cached(kind, image_bytes, lambda: _describe_image(image_bytes, msg_type))
+    if description is None:
+        # falha fica fora do cache: com ffmpeg/suporte instalado, a mídia é analisada na próxima vez
+        label = "vídeo" if msg_type == "video" else "arquivo"
+        return f"({label} recebido, não foi possível analisar o conteúdo)"
+    return description
 
-    # monta o content multimodal (texto + imagem)
+
+def _describe_image(image_bytes, msg_type: str = "image"):
+    """Descrição da mídia pela API de visão, ou None se ela não puder ser enviada."""
+    # tipo real detectado, tamanho reduzido; vídeo -> keyframes
+    parts = prepare_media(image_bytes, msg_type)
+    if not parts:
+        # vídeo sem ffmpeg, PDF, HEIC sem suporte etc.: não vai para a API de visão
+        return None
+
+    # monta o content multimodal (texto + imagens como data URI base64)
     content = [
         {"type": "text",  "text": "você irá passar a mensagem para um chatbot que espera textos. comente de forma objetiva esta imagem, atue como se estivesse vendo e interagindo, nao revele que voce esta descrevendo a imagem:"},
-        {"type": "image_url", "image_url": {"url": data_uri}}
     ]
+    for data, mimetype in parts:
+        b64 = base64.b64encode(data).decode()
+        content.append({"type": "image_url", "image_url": {"url": f"data:{mimetype};base64,{b64}"}})
 
     # chama o modelo gpt-4.1-mini
-    resp = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "user", "content": content}],
-    )
+    with metrics.timed("media.vision"):
+        resp = client.chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=[{"role": "user", "content": content}],
+        )
     return resp.choices[0].message.content.strip()
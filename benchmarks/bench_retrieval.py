@@ -0,0 +1,92 @@
+# benchmarks/bench_retrieval.py
+#
+# Compara a busca top-k atual (llama_index SimpleVectorStore, que pontua nó a nó em Python)
+# com a MatrixSearch (produto matriz-vetor + argpartition) em 1k, 10k e 100k chunks.
+#
+#   python benchmarks/bench_retrieval.py [--dim 1536] [--sizes 1000,10000,100000] [--queries 20]
+
+import argparse
+import heapq
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_search import MatrixSearch  # noqa: E402
+
+try:
+    from llama_index.core.indices.query.embedding_utils import get_top_k_embeddings
+except ImportError:
+    get_top_k_embeddings = None
+
+
+def _python_top_k(query, embeddings, ids, top_k):
+    """Equivalente ao caminho do llama_index quando ele não está instalado: cosseno nó a nó."""
+    q = np.asarray(query)
+    q_norm = np.linalg.norm(q)
+    heap = []
+    for emb, node_id in zip(embeddings, ids):
+        e = np.asarray(emb)
+        score = float(np.dot(q, e) / (q_norm * np.linalg.norm(e)))
+        if len(heap) < top_k:
+            heapq.heappush(heap, (score, node_id))
+        else:
+            heapq.heappushpop(heap, (score, node_id))
+    heap.sort(reverse=True)
+    return [s for s, _ in heap], [i for _, i in heap]
+
+
+def baseline(query, embeddings, ids, top_k):
+    if get_top_k_embeddings is not None:
+        return get_top_k_embeddings(query, embeddings, similarity_top_k=top_k, embedding_ids=ids)
+    return _python_top_k(query, embeddings, ids, top_k)
+
+
+def _timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--baseline-max", type=int, default=100000,
+                        help="pula o caminho atual acima deste tamanho (é lento)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    name = "llama_index" if get_top_k_embeddings is not None else "python (nó a nó)"
+    print(f"dim={args.dim} top_k={args.top_k} queries={args.queries} baseline={name}")
+    print(f"{'chunks':>8} {'atual ms':>10} {'matriz ms':>10} {'lote ms/q':>10} {'speedup':>8}")
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        matrix = rng.standard_normal((n, args.dim), dtype=np.float32)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        search = MatrixSearch(matrix)
+
+        t_matrix = _timeit(lambda: [search.search(q, args.top_k) for q in queries], 1) / args.queries
+        t_batch = _timeit(lambda: search.search_batch(queries, args.top_k), 1) / args.queries
+
+        if n <= args.baseline_max:
+            embeddings = matrix.tolist()
+            ids = [str(i) for i in range(n)]
+            q0 = queries[0].tolist()
+            t_base = _timeit(lambda: baseline(q0, embeddings, ids, args.top_k), 1)
+            # confere que os dois caminhos concordam
+            _, base_ids = baseline(q0, embeddings, ids, args.top_k)
+            idx, _ = search.search(queries[0], args.top_k)
+            assert [str(i) for i in idx] == list(base_ids), "resultados divergentes"
+            print(f"{n:>8} {t_base * 1000:>10.1f} {t_matrix * 1000:>10.2f} {t_batch * 1000:>10.2f} {t_base / t_matrix:>7.0f}x")
+        else:
+            print(f"{n:>8} {'-':>10} {t_matrix * 1000:>10.2f} {t_batch * 1000:>10.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_startup.py
+#
+# Mede a subida do servidor MCP (server.py):
+# - quebra do tempo de import por pacote (python -X importtime -c "import server");
+# - tempo de parede do spawn até a primeira resposta de list_tools pelo stdio.
+#
+#   python benchmarks/bench_startup.py [--runs 3] [--top 15] [--max-seconds 3.0]
+#
+# Com --max-seconds, sai com código 1 se a mediana até list_tools passar do limite
+# (para pegar regressões de startup, ex.: um import pesado voltando para o topo do módulo).
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_breakdown(module: str = "server") -> tuple:
+    """Retorna (total em s, {pacote de topo: tempo cumulativo em s}) para `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} falhou:\n{proc.stderr[-2000:]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            # profundidade na árvore: 1 espaço no nível 0, +2 por nível
+            entries.append((int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)))
+
+    # a saída é pós-ordem: os filhos diretos do módulo (profundidade 1) vêm logo antes dele
+    pos = max(i for i, (_, depth, name) in enumerate(entries) if depth == 0 and name == module)
+    total = entries[pos][0]
+    per_package = defaultdict(int)
+    for cumulative, depth, name in reversed(entries[:pos]):
+        if depth == 0:
+            break
+        if depth == 1:
+            per_package[name.split(".")[0]] += cumulative
+    return total / 1e6, {k: v / 1e6 for k, v in per_package.items()}
+
+
+async def time_to_list_tools(script: str = "server.py") -> tuple:
+    """Spawn do servidor pelo stdio até a primeira resposta de list_tools. Retorna (segundos, nº de ferramentas)."""
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[script], cwd=ROOT)
+    start = time.perf_counter()
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            tools = await session.list_tools()
+            elapsed = time.perf_counter() - start
+    return elapsed, len(tools.tools)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--skip-spawn", action="store_true", help="só a quebra de imports")
+    args = parser.parse_args()
+
+    total, per_package = import_breakdown(args.module)
+    print(f"import {args.module}: {total * 1000:.0f} ms")
+    print(f"{'pacote':<32} {'ms':>8} {'%':>6}")
+    for name, seconds in sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{name:<32} {seconds * 1000:>8.1f} {100 * seconds / total if total else 0:>6.1f}")
+
+    if args.skip_spawn:
+        return
+
+    timings = []
+    for i in range(args.runs):
+        elapsed, n_tools = asyncio.run(time_to_list_tools(f"{args.module}.py"))
+        timings.append(elapsed)
+        print(f"run {i + 1}: spawn -> list_tools em {elapsed * 1000:.0f} ms ({n_tools} ferramentas)")
+    median = statistics.median(timings)
+    print(f"mediana: {median * 1000:.0f} ms")
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"REGRESSÃO: {median:.2f}s > limite de {args.max_seconds:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
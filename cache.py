@@ -0,0 +1,144 @@
+# cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import metrics
+
+CONVERSATION_MAX_CONTACTS = int(os.getenv("CONVERSATION_MAX_CONTACTS", "200"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(6 * 3600)))
+RECENT_IDS_SIZE = int(os.getenv("RECENT_IDS_SIZE", "5000"))
+
+
+class ConversationCache:
+    """
+    Histórico em RAM por contato, limitado:
+    - no máximo `max_contacts` contatos (despeja o usado há mais tempo, LRU);
+    - no máximo `max_turns` entradas por contato (as mais antigas saem);
+    - contatos sem atividade há mais de `ttl` segundos expiram.
+
+    Contadores (hits, misses, evictions, expirations) também vão para metrics (conversation.*).
+    """
+
+    def __init__(self, max_contacts: int = CONVERSATION_MAX_CONTACTS,
+                 max_turns: int = CONVERSATION_MAX_TURNS, ttl: float = CONVERSATION_TTL):
+        self.max_contacts = max_contacts
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self._data = OrderedDict()  # contato -> (último acesso, deque de turnos)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _count(self, name: str):
+        setattr(self, name, getattr(self, name) + 1)
+        metrics.incr(f"conversation.{name}")
+
+    def get(self, contact: str):
+        """Retorna a lista de turnos do contato, ou None se não estiver em cache (ou expirou)."""
+        with self._lock:
+            item = self._data.get(contact)
+            if item is not None and time.monotonic() - item[0] > self.ttl:
+                del self._data[contact]
+                self._count("expirations")
+                item = None
+            if item is None:
+                self._count("misses")
+                return None
+            self._count("hits")
+            self._data[contact] = (time.monotonic(), item[1])
+            self._data.move_to_end(contact)
+            return list(item[1])
+
+    def set(self, contact: str, turns):
+        with self._lock:
+            self._data[contact] = (time.monotonic(), deque(turns, maxlen=self.max_turns))
+            self._data.move_to_end(contact)
+            self._evict()
+
+    def append(self, contact: str, turn):
+        with self._lock:
+            item = self._data.get(contact)
+            turns = item[1] if item is not None else deque(maxlen=self.max_turns)
+            turns.append(turn)
+            self._data[contact] = (time.monotonic(), turns)
+            self._data.move_to_end(contact)
+            self._evict()
+
+    def __contains__(self, contact: str) -> bool:
+        with self._lock:
+            item = self._data.get(contact)
+            return item is not None and time.monotonic() - item[0] <= self.ttl
+
+    def _evict(self):
+        while len(self._data) > self.max_contacts:
+            self._data.popitem(last=False)
+            self._count("evictions")
+
+    def stats(self) -> dict:
+        return {
+            "contacts": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RecentIds:
+    """
+    Conjunto de tamanho fixo com os IDs de mensagens vistos recentemente (dedup do webhook).
+    Ao passar de `maxlen`, o ID mais antigo sai.
+    """
+
+    def __init__(self, maxlen: int = RECENT_IDS_SIZE):
+        self.maxlen = maxlen
+        self._order = deque()
+        self._ids = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def check_and_add(self, item) -> bool:
+        """Retorna True se o ID já foi visto; caso contrário registra e retorna False."""
+        with self._lock:
+            if item in self._ids:
+                self.hits += 1
+                metrics.incr("dedup.hits")
+                return True
+            self.misses += 1
+            metrics.incr("dedup.misses")
+            self._ids.add(item)
+            self._order.append(item)
+            if len(self._order) > self.maxlen:
+                self._ids.discard(self._order.popleft())
+                self.evictions += 1
+                metrics.incr("dedup.evictions")
+            return False
+
+    def discard(self, item):
+        """Esquece o ID (mensagem não foi aceita; a retentativa do webhook deve ser processada)."""
+        with self._lock:
+            if item in self._ids:
+                self._ids.discard(item)
+                self._order.remove(item)
+
+    def __contains__(self, item) -> bool:
+        return item in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,210 @@
+# embedding_pipeline.py
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from metrics import metrics
+
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai")  # "openai" ou "fake" (testes/offline)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))        # API aceita até 2048 entradas
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "200000"))  # API aceita até 300k tokens
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = float(os.getenv("EMBED_RPM", "500"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join("vector_store", "embedding_cache.sqlite"))
+
+
+def _approx_tokens(text: str) -> int:
+    # ~4 caracteres por token: suficiente para respeitar o limite do lote
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """Token bucket assíncrono: no máximo `rate_per_minute` aquisições por minuto, com rajada `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class EmbeddingCache:
+    """Cache em disco (SQLite) de vetores por (modelo, hash do chunk)."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for k, blob in rows:
+                    found[k] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                [(k, model, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class OpenAIEmbedder:
+    def __init__(self, model: str = "text-embedding-ada-002"):
+        from openai import AsyncOpenAI
+
+        self.model = model
+        self.client = AsyncOpenAI()
+
+    async def embed(self, texts: list) -> list:
+        resp = await self.client.embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+class FakeEmbedder:
+    """Embedder local e determinístico (mesmo texto => mesmo vetor unitário). Conta as chamadas."""
+
+    def __init__(self, model: str = "fake-embedding", dim: int = 64):
+        self.model = model
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    async def embed(self, texts: list) -> list:
+        self.calls += 1
+        self.texts += len(texts)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vectors.append((v / np.linalg.norm(v)).tolist())
+        return vectors
+
+
+class EmbeddingPipeline:
+    """
+    Etapa de embedding do indexador:
+    - reaproveita vetores do cache em disco (chave: modelo + sha256 do chunk);
+    - agrupa os chunks restantes em lotes dentro dos limites do modelo;
+    - executa até `concurrency` lotes ao mesmo tempo, respeitando o rate limiter.
+
+    Métricas: embed.batch (latência por lote), embed.cache_hits / embed.cache_misses / embed.batches.
+    """
+
+    def __init__(self, embedder, cache: EmbeddingCache = None, batch_size: int = EMBED_BATCH_SIZE,
+                 batch_tokens: int = EMBED_BATCH_TOKENS, concurrency: int = EMBED_CONCURRENCY,
+                 limiter: RateLimiter = None):
+        self.embedder = embedder
+        self.cache = cache
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter(EMBED_RPM, burst=concurrency)
+
+    def _batches(self, texts: list) -> list:
+        batches, current, tokens = [], [], 0
+        for text in texts:
+            t = _approx_tokens(text)
+            if current and (len(current) >= self.batch_size or tokens + t > self.batch_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += t
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(self, texts: list) -> list:
+        """Retorna um vetor por texto, na mesma ordem."""
+        model = self.embedder.model
+        keys = [EmbeddingCache.key(model, t) for t in texts]
+        vectors = self.cache.get_many(set(keys)) if self.cache else {}
+        metrics.incr("embed.cache_hits", sum(1 for k in keys if k in vectors))
+
+        # textos únicos que ainda não têm vetor
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in vectors:
+                missing.setdefault(k, t)
+        metrics.incr("embed.cache_misses", len(missing))
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            batches = self._batches(list(missing.values()))
+
+            async def run(batch):
+                async with semaphore:
+                    await self.limiter.acquire()
+                    start = time.perf_counter()
+                    result = await self.embedder.embed(batch)
+                    metrics.observe("embed.batch", time.perf_counter() - start)
+                    metrics.incr("embed.batches")
+                    return batch, result
+
+            fresh = {}
+            for batch, result in await asyncio.gather(*(run(b) for b in batches)):
+                for text, vector in zip(batch, result):
+                    fresh[EmbeddingCache.key(model, text)] = vector
+            if self.cache:
+                self.cache.put_many(model, fresh)
+            vectors.update(fresh)
+
+        return [vectors[k] for k in keys]
+
+
+_pipelines = {}
+_cache = None
+
+
+def get_embedding_pipeline(model: str = "text-embedding-ada-002") -> EmbeddingPipeline:
+    """
+    Pipeline do processo para o modelo (um por modelo; EMBED_PROVIDER=fake usa o FakeEmbedder).
+    Todos compartilham o mesmo cache em disco, que já separa os vetores por modelo.
+    """
+    global _cache
+    pipeline = _pipelines.get(model)
+    if pipeline is None:
+        if _cache is None:
+            _cache = EmbeddingCache(EMBED_CACHE_PATH)
+        embedder = FakeEmbedder() if EMBED_PROVIDER == "fake" else OpenAIEmbedder(model)
+        pipeline = _pipelines[model] = EmbeddingPipeline(embedder, _cache)
+    return pipeline
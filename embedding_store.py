@@ -0,0 +1,157 @@
+# embedding_store.py
+
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from vector_search import MatrixSearch
+
+# Formato binário do "second brain":
+#   store.json              -> cabeçalho (dtype, dim, count, model, generation, arquivos)
+#   embeddings-<gen>.<dt>   -> matriz contígua count x dim (float32 ou float16), lida via memmap
+#   nodes-<gen>.jsonl       -> um nó por linha, na mesma ordem da matriz: id, text, metadata
+# O cabeçalho é trocado por último com os.replace, então leitores nunca veem uma geração pela metade.
+# As linhas são gravadas já normalizadas: o produto escalar é a similaridade de cosseno.
+
+MMAP_STORE_DIR = os.path.join("vector_store", "mmap")
+# Formato usado pelo search_brain: "json" (store padrão do llama_index) ou "mmap" (este módulo)
+BRAIN_STORE_FORMAT = os.getenv("BRAIN_STORE_FORMAT", "json")
+BRAIN_STORE_DTYPE = os.getenv("BRAIN_STORE_DTYPE", "float32")
+HEADER_FILE = "store.json"
+DTYPES = {"float32": np.float32, "float16": np.float16}
+# Metadados guardados no sidecar (o resto do docstore não é necessário para a busca)
+KEEP_METADATA = ("file_name", "file_path", "last_modified_date")
+
+
+class EmbeddingStore:
+    """Embeddings mapeados em memória (np.memmap) + metadados dos nós."""
+
+    def __init__(self, path: str = MMAP_STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+        self.dim = self.header["dim"]
+        self.count = self.header["count"]
+        self.model = self.header.get("model")
+        dtype = DTYPES[self.header["dtype"]]
+        if self.count:
+            self.matrix = np.memmap(os.path.join(path, self.header["embeddings"]),
+                                    dtype=dtype, mode="r", shape=(self.count, self.dim))
+        else:
+            self.matrix = np.zeros((0, self.dim), dtype=dtype)
+        self.nodes = []
+        with open(os.path.join(path, self.header["nodes"]), encoding="utf-8") as f:
+            for line in f:
+                self.nodes.append(json.loads(line))
+        # stores antigos (sem "normalized") são normalizados em RAM
+        self.searcher = MatrixSearch(self.matrix, normalize=not self.header.get("normalized", False))
+
+    def search(self, query_embedding, top_k: int = 5) -> list:
+        """Retorna [(score, node)] por similaridade de cosseno, do mais ao menos similar."""
+        idx, scores = self.searcher.search(query_embedding, top_k)
+        return [(float(score), self.nodes[i]) for i, score in zip(idx, scores)]
+
+    def search_batch(self, query_embeddings, top_k: int = 5) -> list:
+        return [
+            [(float(score), self.nodes[i]) for i, score in zip(idx, scores)]
+            for idx, scores in self.searcher.search_batch(query_embeddings, top_k)
+        ]
+
+
+def write_store(path: str, ids, embeddings, texts, metadatas, dtype: str = "float32", model: str = None):
+    """Grava uma nova geração do store e publica o cabeçalho atomicamente."""
+    os.makedirs(path, exist_ok=True)
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = (matrix / norms).astype(DTYPES[dtype])
+    generation = time.time_ns()
+    emb_file = f"embeddings-{generation}.{'f16' if dtype == 'float16' else 'f32'}"
+    nodes_file = f"nodes-{generation}.jsonl"
+
+    matrix.tofile(os.path.join(path, emb_file))
+    with open(os.path.join(path, nodes_file), "w", encoding="utf-8") as f:
+        for node_id, text, metadata in zip(ids, texts, metadatas):
+            meta = {k: metadata[k] for k in KEEP_METADATA if k in (metadata or {})}
+            f.write(json.dumps({"id": node_id, "text": text, "metadata": meta}, ensure_ascii=False) + "\n")
+
+    header = {
+        "dtype": dtype,
+        "dim": int(matrix.shape[1]) if matrix.size else 0,
+        "count": len(ids),
+        "model": model,
+        "normalized": True,
+        "generation": generation,
+        "embeddings": emb_file,
+        "nodes": nodes_file,
+    }
+    tmp = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp, os.path.join(path, HEADER_FILE))
+
+    # remove gerações antigas (leitores já abertos continuam com seus memmaps no Linux)
+    for name in os.listdir(path):
+        if (name.startswith("embeddings-") or name.startswith("nodes-")) and name not in (emb_file, nodes_file):
+            os.remove(os.path.join(path, name))
+    return header
+
+
+def convert_json_store(src_dir: str = "vector_store", dst_dir: str = MMAP_STORE_DIR,
+                       dtype: str = "float32", model: str = "text-embedding-ada-002") -> dict:
+    """Converte o store JSON do llama_index (default__vector_store.json + docstore.json) para o formato binário."""
+    with open(os.path.join(src_dir, "default__vector_store.json")) as f:
+        embedding_dict = json.load(f).get("embedding_dict", {})
+    with open(os.path.join(src_dir, "docstore.json")) as f:
+        docs = json.load(f).get("docstore/data", {})
+
+    ids, embeddings, texts, metadatas = [], [], [], []
+    for node_id, embedding in embedding_dict.items():
+        data = docs.get(node_id, {}).get("__data__", {})
+        ids.append(node_id)
+        embeddings.append(embedding)
+        texts.append(data.get("text", ""))
+        metadatas.append(data.get("metadata", {}))
+    return write_store(dst_dir, ids, embeddings, texts, metadatas, dtype=dtype, model=model)
+
+
+def export_binary_store(src_dir: str = "vector_store", model: str = "text-embedding-ada-002"):
+    """Regrava o store binário a partir do JSON recém-persistido, se BRAIN_STORE_FORMAT=mmap."""
+    if BRAIN_STORE_FORMAT != "mmap":
+        return None
+    header = convert_json_store(src_dir, MMAP_STORE_DIR, BRAIN_STORE_DTYPE, model)
+    print(f"Store binário atualizado: {header['count']} embeddings ({header['dtype']})", file=sys.stderr)
+    return header
+
+
+_store = None
+_store_mtime = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store(path: str = MMAP_STORE_DIR) -> EmbeddingStore:
+    """Store residente, reaberto quando o cabeçalho (nova geração) muda no disco."""
+    global _store, _store_mtime
+    mtime = os.stat(os.path.join(path, HEADER_FILE)).st_mtime_ns
+    if _store is not None and _store.path == path and mtime == _store_mtime:
+        return _store
+    with _store_lock:
+        if _store is None or _store.path != path or mtime != _store_mtime:
+            _store, _store_mtime = EmbeddingStore(path), mtime
+    return _store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Converte o vector_store JSON para o formato binário (memmap).")
+    parser.add_argument("--src", default="vector_store")
+    parser.add_argument("--dst", default=MMAP_STORE_DIR)
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32")
+    args = parser.parse_args()
+    header = convert_json_store(args.src, args.dst, args.dtype)
+    print(f"{header['count']} embeddings ({header['dim']} dims, {header['dtype']}) gravados em {args.dst}")
@@ -2,31 +2,27 @@ import os
 import json
 from agents import Agent, Runner, gen_trace_id, trace, WebSearchTool
 from agents.model_settings import ModelSettings
-from agents.mcp import MCPServerStdio
 
-# Parâmetros do subprocesso MCP que expõe Gmail
-server_params = {
-    "command": "python",
-    "args": ["server.py"],
-    "env": os.environ.copy(),
-}
+from mcp_pool import get_mcp_pool
 
 async def relay_gmail_request(user_message: str) -> str:
     """
     Sub-agente dedicado a operações Gmail via MCP.
     Recebe a mensagem do usuário e usa automaticamente a ferramenta Gmail apropriada.
     """
-    async with MCPServerStdio(params=server_params) as mcp_server:
+    async with get_mcp_pool().borrow() as mcp_server:
         # Prompt ideal para orientar o uso das ferramentas Gmail
         SYSTEM_PROMPT = (
             "Você é Arthur, engenheiro direto.\n"
             "Ferramentas Gmail disponíveis via MCP:\n"
             "- search_gmail(query, max_results): retorna IDs de mensagens que atendem à query.\n"
-            "- get_gmail(query): retorna assunto, remetente e corpo da primeira mensagem que corresponde à query.\n"
+            "- list_gmail(query, max_results): lista várias mensagens de uma vez (assunto, remetente e trecho de cada).\n"
+            "- get_gmail(query, max_results=1): retorna assunto, remetente e corpo das mensagens que correspondem à query.\n"
             "- send_gmail(to, subject, body): envia um e-mail.\n"
             "Use a ferramenta certa conforme a solicitação: \n"
-            "• Para buscar e-mails, use search_gmail.\n"
-            "• Para ler conteúdo, use get_gmail.\n"
+            "• Para ver ou listar vários e-mails, use list_gmail (uma chamada para todos, sem ler um por um).\n"
+            "• Para buscar só os IDs, use search_gmail.\n"
+            "• Para ler o corpo de uma mensagem específica, use get_gmail.\n"
             "• Para enviar ou responder, use send_gmail.\n"
             "Não explique como a ferramenta funciona, só retorne o resultado sem mais perguntas.\n"
         )
@@ -0,0 +1,130 @@
+# gmail_mime.py
+
+import base64
+import html
+import os
+import re
+from html.parser import HTMLParser
+
+from metrics import metrics
+
+GMAIL_BODY_MAX_BYTES = int(os.getenv("GMAIL_BODY_MAX_BYTES", str(64 * 1024)))
+GMAIL_DECODE_CHUNK = 64 * 1024  # caracteres base64 por passo (múltiplo de 4)
+TRUNCATED_MARK = "\n[... corpo truncado]"
+
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote", "hr"}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+
+def _headers(part: dict) -> dict:
+    return {h["name"].lower(): h["value"] for h in part.get("headers", [])}
+
+
+def _charset(part: dict) -> str:
+    m = re.search(r'charset="?([\w.-]+)"?', _headers(part).get("content-type", ""), re.IGNORECASE)
+    return m.group(1) if m else "utf-8"
+
+
+def is_attachment(part: dict) -> bool:
+    """Anexos são pulados sem decodificar: têm nome de arquivo, attachmentId ou disposition attachment."""
+    if part.get("filename") or part.get("body", {}).get("attachmentId"):
+        return True
+    return _headers(part).get("content-disposition", "").lower().startswith("attachment")
+
+
+def iter_parts(payload: dict):
+    """Percorre a árvore MIME (multipart/* e message/rfc822 aninhados) em profundidade, sem anexos."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if is_attachment(part):
+            continue
+        children = part.get("parts")
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def decode_body(data: str, max_bytes: int) -> tuple:
+    """
+    Decodifica base64url em blocos até `max_bytes`, sem decodificar o resto.
+    Retorna (bytes, truncado).
+    """
+    out = bytearray()
+    for start in range(0, len(data), GMAIL_DECODE_CHUNK):
+        chunk = data[start:start + GMAIL_DECODE_CHUNK]
+        out += base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4))
+        if len(out) >= max_bytes:
+            return bytes(out[:max_bytes]), len(out) > max_bytes or start + GMAIL_DECODE_CHUNK < len(data)
+    return bytes(out), False
+
+
+class _HTMLText(HTMLParser):
+    """HTML -> texto: ignora script/style, quebra linha nos blocos, preserva o href dos links."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.out.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.out.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.out.append(data)
+
+    def text(self) -> str:
+        text = html.unescape("".join(self.out)).replace("\xa0", " ")
+        text = re.sub(r"[ \t]+", " ", text)
+        return re.sub(r"\s*\n\s*(\n\s*)+", "\n\n", text).strip()
+
+
+def html_to_text(markup: str) -> str:
+    parser = _HTMLText()
+    parser.feed(markup)
+    parser.close()
+    return parser.text()
+
+
+def extract_body(payload: dict, max_bytes: int = GMAIL_BODY_MAX_BYTES) -> str:
+    """
+    Melhor corpo de texto de uma mensagem do Gmail (format='full'):
+    o primeiro text/plain da árvore MIME ou, na falta dele, o primeiro text/html convertido em texto.
+    Decodifica no máximo `max_bytes` do corpo escolhido; anexos nunca são decodificados.
+    """
+    plain = html_part = None
+    for part in iter_parts(payload):
+        if not part.get("body", {}).get("data"):
+            continue
+        mime = part.get("mimeType", "").lower()
+        if mime == "text/plain":
+            plain = part
+            break
+        if mime == "text/html" and html_part is None:
+            html_part = part
+
+    part = plain or html_part
+    if part is None:
+        return ""
+    raw, truncated = decode_body(part["body"]["data"], max_bytes)
+    try:
+        text = raw.decode(_charset(part), errors="ignore")
+    except LookupError:
+        text = raw.decode("utf-8", errors="ignore")
+    if part is html_part:
+        text = html_to_text(text)
+    if truncated:
+        metrics.incr("gmail.body_truncated")
+        text += TRUNCATED_MARK
+    return text
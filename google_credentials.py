@@ -0,0 +1,146 @@
+# google_credentials.py
+
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from metrics import metrics
+
+GOOGLE_REFRESH_MARGIN = float(os.getenv("GOOGLE_REFRESH_MARGIN", "300"))    # renova 5 min antes de expirar
+GOOGLE_REFRESH_INTERVAL = float(os.getenv("GOOGLE_REFRESH_INTERVAL", "60"))
+DISCOVERY_CACHE_DIR = os.getenv("DISCOVERY_CACHE_DIR", os.path.join("cache", "discovery"))
+DISCOVERY_CACHE_TTL = float(os.getenv("DISCOVERY_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+class _Entry:
+    def __init__(self, token_path: str, creds, saved: str):
+        self.token_path = token_path
+        self.creds = creds
+        self.saved = saved
+        self.lock = threading.Lock()
+
+
+class CredentialManager:
+    """
+    Credenciais OAuth compartilhadas pelos serviços Google (Gmail, Calendar, Drive).
+
+    - Uma entrada por arquivo de token; serviços com o mesmo token usam o mesmo objeto Credentials.
+    - Uma thread em background renova os tokens `margin` segundos antes de expirarem, para
+      nenhuma chamada de ferramenta pagar o refresh.
+    - O token só é gravado em disco quando o JSON muda (refresh ou novo login), de forma atômica.
+
+    Métricas: google.refreshes / google.refresh_errors / google.token_writes.
+    """
+
+    def __init__(self, margin: float = GOOGLE_REFRESH_MARGIN, interval: float = GOOGLE_REFRESH_INTERVAL):
+        self.margin = margin
+        self.interval = interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, token_path: str, scopes: list, client_secrets: str, port: int = 0):
+        """Credentials válidas para o arquivo de token (login interativo se não houver token)."""
+        with self._lock:
+            entry = self._entries.get(token_path)
+            if entry is None:
+                entry = self._entries[token_path] = self._load(token_path, scopes, client_secrets, port)
+            self._start()
+        return entry.creds
+
+    def _load(self, token_path: str, scopes: list, client_secrets: str, port: int) -> _Entry:
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        creds, saved = None, None
+        if os.path.exists(token_path):
+            with open(token_path) as f:
+                saved = f.read()
+            creds = Credentials.from_authorized_user_info(json.loads(saved), scopes)
+        entry = _Entry(token_path, creds, saved)
+        if creds and creds.refresh_token and (not creds.valid or self._expiring(creds)):
+            self._refresh(entry)
+        if not entry.creds or not entry.creds.valid:
+            flow = InstalledAppFlow.from_client_secrets_file(client_secrets, scopes)
+            entry.creds = flow.run_local_server(port=port)
+            self._save(entry)
+        return entry
+
+    def _expiring(self, creds) -> bool:
+        # expiry do google-auth é um datetime UTC sem timezone
+        if creds.expiry is None:
+            return False
+        return creds.expiry - datetime.datetime.utcnow() < datetime.timedelta(seconds=self.margin)
+
+    def _refresh(self, entry: _Entry):
+        from google.auth.transport.requests import Request
+
+        with entry.lock:
+            try:
+                entry.creds.refresh(Request())
+                metrics.incr("google.refreshes")
+            except Exception as e:
+                metrics.incr("google.refresh_errors")
+                print(f"Falha ao renovar token {entry.token_path}: {e}", file=sys.stderr)
+                return
+            self._save(entry)
+
+    def _save(self, entry: _Entry):
+        data = entry.creds.to_json()
+        if data == entry.saved:
+            return
+        tmp = entry.token_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, entry.token_path)
+        entry.saved = data
+        metrics.incr("google.token_writes")
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="google-credentials", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                entries = list(self._entries.values())
+            for entry in entries:
+                if entry.creds.refresh_token and self._expiring(entry.creds):
+                    self._refresh(entry)
+                else:
+                    # o AuthorizedHttp também renova sozinho (401): persiste se o token mudou
+                    with entry.lock:
+                        self._save(entry)
+
+
+def build_service(name: str, version: str, credentials, cache_dir: str = DISCOVERY_CACHE_DIR):
+    """
+    build() do googleapiclient a partir do documento de discovery em cache local
+    (cache/discovery/<nome>.<versão>.json): sem rede, só o parse do JSON.
+    Sem cache (ou expirado), faz o build normal e grava o documento usado.
+    """
+    from googleapiclient.discovery import build, build_from_document
+
+    path = os.path.join(cache_dir, f"{name}.{version}.json")
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < DISCOVERY_CACHE_TTL:
+        with open(path) as f:
+            document = f.read()
+        metrics.incr("google.discovery_hits")
+        return build_from_document(document, credentials=credentials)
+
+    metrics.incr("google.discovery_misses")
+    service = build(name, version, credentials=credentials)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(service._rootDesc, f)
+    os.replace(tmp, path)
+    return service
+
+
+credentials = CredentialManager()
@@ -0,0 +1,72 @@
+# google_exec.py
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+GOOGLE_WORKERS = int(os.getenv("GOOGLE_WORKERS", "8"))
+GOOGLE_TIMEOUT = float(os.getenv("GOOGLE_TIMEOUT", "30"))
+
+
+class GoogleExecutor:
+    """
+    Executa as chamadas bloqueantes do googleapiclient (request.execute()) fora do event loop.
+
+    - Pool de `workers` threads: no máximo esse número de chamadas Google ao mesmo tempo;
+      as demais esperam na fila do pool.
+    - httplib2.Http não é thread-safe, então cada thread usa seu próprio AuthorizedHttp
+      (por credencial), com timeout de socket igual ao timeout da chamada.
+    - Cada chamada tem timeout (`timeout`, inclui a espera na fila) e registra a latência
+      em metrics como google.<nome>; contadores google.timeouts / google.errors.
+    """
+
+    def __init__(self, workers: int = GOOGLE_WORKERS, timeout: float = GOOGLE_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="google")
+        self._local = threading.local()
+
+    def _http(self, credentials):
+        import google_auth_httplib2
+        import httplib2
+
+        cache = getattr(self._local, "http", None)
+        if cache is None:
+            cache = self._local.http = {}
+        http = cache.get(id(credentials))
+        if http is None:
+            http = cache[id(credentials)] = google_auth_httplib2.AuthorizedHttp(
+                credentials, http=httplib2.Http(timeout=self.timeout)
+            )
+        return http
+
+    def _execute(self, request, credentials):
+        if credentials is None:
+            return request.execute()
+        return request.execute(http=self._http(credentials))
+
+    async def execute(self, request, name: str, credentials=None, timeout: float = None):
+        """Executa um HttpRequest do googleapiclient numa thread do pool e retorna o resultado."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = loop.run_in_executor(self._pool, self._execute, request, credentials)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("google.timeouts")
+            raise TimeoutError(f"Chamada Google '{name}' excedeu {timeout or self.timeout:.0f}s")
+        except Exception:
+            metrics.incr("google.errors")
+            raise
+        finally:
+            metrics.observe(f"google.{name}", time.perf_counter() - start)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+google_exec = GoogleExecutor()
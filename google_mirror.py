@@ -0,0 +1,562 @@
+# google_mirror.py
+
+import argparse
+import asyncio
+import datetime
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from metrics import metrics
+
+GOOGLE_MIRROR = os.getenv("GOOGLE_MIRROR", "false").lower() == "true"
+MIRROR_PATH = os.getenv("MIRROR_PATH", os.path.join("cache", "google_mirror.sqlite"))
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "60"))
+MIRROR_MAX_STALENESS = float(os.getenv("MIRROR_MAX_STALENESS", "300"))
+MIRROR_GMAIL_MAX = int(os.getenv("MIRROR_GMAIL_MAX", "500"))      # mensagens mais recentes no espelho
+MIRROR_CONCURRENCY = int(os.getenv("MIRROR_CONCURRENCY", "8"))
+MIRROR_RECORD = os.getenv("MIRROR_RECORD")                          # grava as respostas da API como fixture
+
+MIRROR_SOURCES = ("gmail", "calendar", "drive")
+GMAIL_HEADERS = ["Subject", "From", "Date"]
+GMAIL_SYSTEM_LABELS = {"INBOX", "SENT", "STARRED", "UNREAD", "IMPORTANT", "SPAM", "TRASH", "DRAFT"}
+GMAIL_IS_LABELS = {"UNREAD", "STARRED", "IMPORTANT"}
+GMAIL_HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+DRIVE_FILE_FIELDS = "id, name, mimeType, webViewLink, modifiedTime, trashed"
+
+
+class MirrorHttpError(Exception):
+    """Erro HTTP da API durante a sincronização (404/410 indicam cursor expirado)."""
+
+    def __init__(self, call: str, status: int):
+        super().__init__(f"{call}: HTTP {status}")
+        self.call = call
+        self.status = status
+
+
+# ------------------------------ transportes ------------------------------
+
+class ApiTransport:
+    """
+    Chamadas reais à API: "gmail.users.messages.list" vira
+    service.users().messages().list(**params), executado pelo google_exec.
+    `services` mapeia "gmail"/"calendar"/"drive" para objetos com `async get()` (LazyService).
+    """
+
+    def __init__(self, services: dict):
+        self.services = services
+
+    async def call(self, name: str, **params) -> dict:
+        from googleapiclient.errors import HttpError
+        from google_exec import google_exec
+
+        api, *path = name.split(".")
+        svc = await self.services[api].get()
+        resource = svc.service
+        for attr in path[:-1]:
+            resource = getattr(resource, attr)()
+        request = getattr(resource, path[-1])(**params)
+        try:
+            return await google_exec.execute(request, f"mirror.{api}", svc.creds)
+        except HttpError as e:
+            raise MirrorHttpError(name, e.resp.status) from e
+
+
+class FixtureTransport:
+    """
+    Reproduz respostas gravadas (JSON: lista de {"call", "params", "response"} ou {"call", "params", "status"}).
+    Cada registro é consumido uma vez, na ordem; "params" do registro precisa ser subconjunto
+    dos parâmetros da chamada. As chamadas feitas ficam em `calls`.
+    """
+
+    def __init__(self, records):
+        if isinstance(records, str):
+            with open(records) as f:
+                records = json.load(f)
+        self.records = list(records)
+        self.calls = []
+
+    async def call(self, name: str, **params) -> dict:
+        self.calls.append((name, params))
+        for i, rec in enumerate(self.records):
+            if rec["call"] == name and all(params.get(k) == v for k, v in rec.get("params", {}).items()):
+                self.records.pop(i)
+                if "status" in rec:
+                    raise MirrorHttpError(name, rec["status"])
+                return rec["response"]
+        raise LookupError(f"Sem resposta gravada para {name} {params}")
+
+
+class RecordingTransport:
+    """Repassa as chamadas para `inner` e grava pedido + resposta em `path` (fixture para o FixtureTransport)."""
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.path = path
+        self.records = []
+
+    async def call(self, name: str, **params) -> dict:
+        try:
+            response = await self.inner.call(name, **params)
+        except MirrorHttpError as e:
+            self.records.append({"call": name, "params": params, "status": e.status})
+            self._save()
+            raise
+        self.records.append({"call": name, "params": params, "response": response})
+        self._save()
+        return response
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.records, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+# ------------------------------ espelho SQLite ------------------------------
+
+def _timestamp(value: dict) -> float:
+    """start/end do Calendar ({"dateTime"} ou {"date"}) como epoch UTC."""
+    value = value or {}
+    if value.get("dateTime"):
+        return datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")).timestamp()
+    if value.get("date"):
+        return datetime.datetime.fromisoformat(value["date"]).replace(tzinfo=datetime.timezone.utc).timestamp()
+    return 0.0
+
+
+class MirrorStore:
+    """
+    Espelho local (SQLite, modo WAL, compartilhado entre processos) de Gmail, Calendar e Drive,
+    com o cursor de sincronização e a hora da última sincronização de cada fonte.
+    """
+
+    def __init__(self, path: str = MIRROR_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sync_state (source TEXT PRIMARY KEY, cursor TEXT, synced_at REAL);"
+            "CREATE TABLE IF NOT EXISTS gmail_messages (id TEXT PRIMARY KEY, thread_id TEXT, internal_date INTEGER,"
+            " date TEXT, sender TEXT, subject TEXT, snippet TEXT, labels TEXT);"
+            "CREATE INDEX IF NOT EXISTS gmail_by_date ON gmail_messages (internal_date);"
+            "CREATE TABLE IF NOT EXISTS calendar_events (id TEXT PRIMARY KEY, start_ts REAL, end_ts REAL, data TEXT);"
+            "CREATE INDEX IF NOT EXISTS calendar_by_start ON calendar_events (start_ts);"
+            "CREATE TABLE IF NOT EXISTS drive_files (id TEXT PRIMARY KEY, name TEXT, modified_time TEXT, data TEXT);"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    # --- estado ---
+
+    def state(self, source: str):
+        """(cursor, synced_at) da fonte, ou (None, None) se nunca sincronizou."""
+        with self._lock:
+            row = self._conn.execute("SELECT cursor, synced_at FROM sync_state WHERE source = ?", (source,)).fetchone()
+        return row or (None, None)
+
+    def is_fresh(self, source: str, max_staleness: float) -> bool:
+        _, synced_at = self.state(source)
+        return synced_at is not None and time.time() - synced_at <= max_staleness
+
+    def reset(self, source: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sync_state WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def _set_cursor(self, source: str, cursor: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (source, cursor, synced_at) VALUES (?, ?, ?)",
+            (source, cursor, time.time()),
+        )
+
+    # --- escrita (cada sincronização é uma transação, cursor incluído) ---
+
+    def apply_gmail(self, cursor: str, upserts: list, deletes=(), labels: dict = None, replace: bool = False):
+        rows = []
+        for msg in upserts:
+            headers = {h["name"]: h["value"] for h in msg.get("payload", {}).get("headers", [])}
+            rows.append((
+                msg["id"], msg.get("threadId"), int(msg.get("internalDate") or 0), headers.get("Date", ""),
+                headers.get("From", ""), headers.get("Subject", ""), msg.get("snippet", ""),
+                f" {' '.join(msg.get('labelIds', []))} ",
+            ))
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM gmail_messages")
+            self._conn.executemany("INSERT OR REPLACE INTO gmail_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM gmail_messages WHERE id = ?", [(i,) for i in deletes])
+            self._conn.executemany(
+                "UPDATE gmail_messages SET labels = ? WHERE id = ?",
+                [(f" {' '.join(ids)} ", msg_id) for msg_id, ids in (labels or {}).items()],
+            )
+            # mantém só as MIRROR_GMAIL_MAX mais recentes
+            self._conn.execute(
+                "DELETE FROM gmail_messages WHERE id NOT IN "
+                "(SELECT id FROM gmail_messages ORDER BY internal_date DESC LIMIT ?)", (MIRROR_GMAIL_MAX,)
+            )
+            self._set_cursor("gmail", cursor)
+
+    def apply_calendar(self, cursor: str, events: list, replace: bool = False):
+        live = [e for e in events if e.get("status") != "cancelled"]
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM calendar_events")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO calendar_events VALUES (?, ?, ?, ?)",
+                [(e["id"], _timestamp(e.get("start")), _timestamp(e.get("end")), json.dumps(e)) for e in live],
+            )
+            self._conn.executemany(
+                "DELETE FROM calendar_events WHERE id = ?",
+                [(e["id"],) for e in events if e.get("status") == "cancelled"],
+            )
+            self._set_cursor("calendar", cursor)
+
+    def apply_drive(self, cursor: str, files: list, removed=(), replace: bool = False):
+        # arquivos na lixeira não entram (files.list do Drive também os omite por padrão)
+        removed = [*removed, *(f["id"] for f in files if f.get("trashed"))]
+        files = [f for f in files if not f.get("trashed")]
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM drive_files")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO drive_files VALUES (?, ?, ?, ?)",
+                [(f["id"], f.get("name", ""), f.get("modifiedTime", ""), json.dumps(f)) for f in files],
+            )
+            self._conn.executemany("DELETE FROM drive_files WHERE id = ?", [(i,) for i in removed])
+            self._set_cursor("drive", cursor)
+
+    # --- leitura ---
+
+    def gmail_search(self, where: str, params: list, limit: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, thread_id, date, sender, subject, snippet FROM gmail_messages WHERE {where} "
+                "ORDER BY internal_date DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [
+            {"id": r[0], "threadId": r[1], "Date": r[2], "From": r[3], "Subject": r[4], "snippet": r[5]}
+            for r in rows
+        ]
+
+    def gmail_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM gmail_messages").fetchone()[0]
+
+    def calendar_upcoming(self, limit: int, now: float = None) -> list:
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM calendar_events WHERE end_ts > ? ORDER BY start_ts LIMIT ?", (now, limit)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def drive_search(self, name_contains: str, limit: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM drive_files WHERE name LIKE ? AND COALESCE(json_extract(data, '$.trashed'), 0) = 0 "
+                "ORDER BY modified_time DESC LIMIT ?",
+                (f"%{name_contains}%", limit),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+# ------------------------------ consultas suportadas ------------------------------
+
+_GMAIL_TOKEN = re.compile(r"^(from|subject|is|in|label):(\S+)$", re.IGNORECASE)
+_DRIVE_NAME = re.compile(r"^\s*name\s+contains\s+'([^'\\]*)'\s*$")
+
+
+def gmail_query_to_sql(query: str):
+    """
+    Traduz o subconjunto de busca do Gmail que o espelho consegue responder
+    (from:, subject:, is:unread/starred/important, in:/label: com labels de sistema) para SQL.
+    Retorna (where, params) ou None (consulta precisa da API, ex.: texto livre no corpo).
+    """
+    clauses, params, requested = [], [], set()
+    for token in (query or "").split():
+        m = _GMAIL_TOKEN.match(token)
+        if not m or '"' in token:
+            return None
+        op, value = m.group(1).lower(), m.group(2)
+        if op == "from":
+            clauses.append("sender LIKE ?")
+            params.append(f"%{value}%")
+        elif op == "subject":
+            clauses.append("subject LIKE ?")
+            params.append(f"%{value}%")
+        else:
+            # o espelho guarda ids de label: só os de sistema coincidem com o nome
+            # (labels do usuário viram Label_123 e vão para a API)
+            allowed = GMAIL_IS_LABELS if op == "is" else GMAIL_SYSTEM_LABELS
+            if value.upper() not in allowed:
+                return None
+            requested.add(value.upper())
+            clauses.append("labels LIKE ?")
+            params.append(f"% {value.upper()} %")
+    # como o users.messages.list, lixeira e spam só aparecem quando pedidos (in:trash / in:spam);
+    # a sincronização por histórico só troca as labels, então essas mensagens continuam no espelho
+    for label in ("TRASH", "SPAM"):
+        if label not in requested:
+            clauses.append("labels NOT LIKE ?")
+            params.append(f"% {label} %")
+    return " AND ".join(clauses), params
+
+
+def drive_query_to_name(query: str):
+    """'' ou "name contains 'x'" -> trecho do nome; outras consultas do Drive -> None (vai para a API)."""
+    if not (query or "").strip():
+        return ""
+    m = _DRIVE_NAME.match(query)
+    return m.group(1) if m else None
+
+
+# ------------------------------ motor de sincronização ------------------------------
+
+class MirrorSync:
+    """
+    Sincronização incremental do espelho local:
+    - Gmail: users.history.list a partir do historyId salvo (404 => ressincroniza do zero);
+    - Calendar: events.list com syncToken (410 => ressincroniza do zero);
+    - Drive: changes.list a partir do page token salvo.
+    A primeira sincronização de cada fonte é completa. Só um processo sincroniza por vez (flock);
+    os demais leem o mesmo SQLite.
+
+    Toda a comunicação passa por `transport.call(nome, **params)`, então o laço roda igual
+    contra a API (ApiTransport) ou contra respostas gravadas (FixtureTransport).
+
+    Métricas: mirror.sync.<fonte> (latência), mirror.changes, mirror.resyncs, mirror.errors,
+    mirror.hits / mirror.fallbacks (leituras servidas pelo espelho ou enviadas à API).
+    """
+
+    def __init__(self, transport, store: MirrorStore, sources=MIRROR_SOURCES, interval: float = MIRROR_SYNC_INTERVAL,
+                 max_staleness: float = MIRROR_MAX_STALENESS, calendar_id: str = "primary"):
+        self.transport = transport
+        self.store = store
+        self.sources = sources
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.calendar_id = calendar_id
+        self._lock_path = store.path + ".lock"
+
+    # --- laço ---
+
+    async def run(self):
+        while True:
+            await self.sync_once()
+            await asyncio.sleep(self.interval)
+
+    async def sync_once(self) -> dict:
+        """Sincroniza todas as fontes. Retorna {fonte: nº de mudanças} ({} se outro processo está sincronizando)."""
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {}
+            counts = {}
+            for source in self.sources:
+                start = time.perf_counter()
+                try:
+                    counts[source] = await self.sync_source(source)
+                    metrics.incr("mirror.changes", counts[source])
+                except Exception as e:
+                    metrics.incr("mirror.errors")
+                    print(f"Erro ao sincronizar {source}: {e}", file=sys.stderr)
+                metrics.observe(f"mirror.sync.{source}", time.perf_counter() - start)
+            return counts
+        finally:
+            os.close(fd)
+
+    async def sync_source(self, source: str) -> int:
+        sync = getattr(self, f"_sync_{source}")
+        cursor, _ = self.store.state(source)
+        try:
+            return await sync(cursor)
+        except MirrorHttpError as e:
+            if cursor is None or e.status not in (404, 410):
+                raise
+            # cursor expirado: recomeça do zero
+            metrics.incr("mirror.resyncs")
+            print(f"Cursor de {source} expirado ({e}); sincronização completa", file=sys.stderr)
+            self.store.reset(source)
+            return await sync(None)
+
+    # --- Gmail ---
+
+    async def _gmail_metadata(self, ids: list) -> list:
+        semaphore = asyncio.Semaphore(MIRROR_CONCURRENCY)
+
+        async def get(msg_id):
+            async with semaphore:
+                try:
+                    return await self.transport.call(
+                        "gmail.users.messages.get", userId="me", id=msg_id,
+                        format="metadata", metadataHeaders=GMAIL_HEADERS,
+                    )
+                except MirrorHttpError as e:
+                    if e.status == 404:  # apagada entre a listagem e o get
+                        return None
+                    raise
+
+        return [m for m in await asyncio.gather(*(get(i) for i in ids)) if m is not None]
+
+    async def _sync_gmail(self, cursor) -> int:
+        if cursor is None:
+            # historyId antes da listagem: mudanças durante a carga entram na próxima rodada
+            history_id = (await self.transport.call("gmail.users.getProfile", userId="me"))["historyId"]
+            ids, page = [], None
+            while len(ids) < MIRROR_GMAIL_MAX:
+                params = {"userId": "me", "maxResults": min(500, MIRROR_GMAIL_MAX - len(ids))}
+                if page:
+                    params["pageToken"] = page
+                resp = await self.transport.call("gmail.users.messages.list", **params)
+                ids.extend(m["id"] for m in resp.get("messages", []))
+                page = resp.get("nextPageToken")
+                if not page:
+                    break
+            messages = await self._gmail_metadata(ids)
+            self.store.apply_gmail(str(history_id), messages, replace=True)
+            return len(messages)
+
+        added, deleted, labels = set(), set(), {}
+        history_id, page = cursor, None
+        while True:
+            params = {"userId": "me", "startHistoryId": cursor, "historyTypes": GMAIL_HISTORY_TYPES}
+            if page:
+                params["pageToken"] = page
+            resp = await self.transport.call("gmail.users.history.list", **params)
+            for record in resp.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    added.add(item["message"]["id"])
+                    deleted.discard(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                    added.discard(item["message"]["id"])
+                for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    labels[item["message"]["id"]] = item["message"].get("labelIds", [])
+            history_id = resp.get("historyId", history_id)
+            page = resp.get("nextPageToken")
+            if not page:
+                break
+        messages = await self._gmail_metadata(sorted(added))
+        labels = {k: v for k, v in labels.items() if k not in added and k not in deleted}
+        self.store.apply_gmail(str(history_id), messages, deleted, labels)
+        return len(added) + len(deleted) + len(labels)
+
+    # --- Calendar ---
+
+    async def _sync_calendar(self, cursor) -> int:
+        params = {"calendarId": self.calendar_id, "singleEvents": True, "maxResults": 2500}
+        if cursor is not None:
+            params.update(syncToken=cursor, showDeleted=True)
+        events, page = [], None
+        while True:
+            resp = await self.transport.call("calendar.events.list", **({**params, "pageToken": page} if page else params))
+            events.extend(resp.get("items", []))
+            page = resp.get("nextPageToken")
+            if not page:
+                break
+        self.store.apply_calendar(resp["nextSyncToken"], events, replace=cursor is None)
+        return len(events)
+
+    # --- Drive ---
+
+    async def _sync_drive(self, cursor) -> int:
+        if cursor is None:
+            start = (await self.transport.call("drive.changes.getStartPageToken"))["startPageToken"]
+            files, page = [], None
+            while True:
+                params = {"q": "trashed=false", "pageSize": 1000, "fields": f"nextPageToken, files({DRIVE_FILE_FIELDS})"}
+                if page:
+                    params["pageToken"] = page
+                resp = await self.transport.call("drive.files.list", **params)
+                files.extend(resp.get("files", []))
+                page = resp.get("nextPageToken")
+                if not page:
+                    break
+            self.store.apply_drive(start, files, replace=True)
+            return len(files)
+
+        changed, removed, page = [], [], cursor
+        while True:
+            resp = await self.transport.call(
+                "drive.changes.list", pageToken=page, pageSize=1000, includeRemoved=True, spaces="drive",
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({DRIVE_FILE_FIELDS}))",
+            )
+            for change in resp.get("changes", []):
+                f = change.get("file")
+                if change.get("removed") or not f or f.get("trashed"):
+                    removed.append(change["fileId"])
+                else:
+                    changed.append(f)
+            if resp.get("newStartPageToken"):
+                new_cursor = resp["newStartPageToken"]
+                break
+            page = resp["nextPageToken"]
+        self.store.apply_drive(new_cursor, changed, removed)
+        return len(changed) + len(removed)
+
+    # --- leitura com limite de defasagem (None => use a API) ---
+
+    def _fresh(self, source: str) -> bool:
+        fresh = self.store.is_fresh(source, self.max_staleness)
+        metrics.incr("mirror.hits" if fresh else "mirror.fallbacks")
+        return fresh
+
+    def read_gmail(self, query: str, max_results: int):
+        sql = gmail_query_to_sql(query)
+        if sql is None:
+            metrics.incr("mirror.fallbacks")
+            return None
+        if not self._fresh("gmail"):
+            return None
+        rows = self.store.gmail_search(sql[0], sql[1], max_results)
+        if len(rows) < max_results and self.store.gmail_count() >= MIRROR_GMAIL_MAX:
+            # o espelho só guarda as mensagens recentes: pode haver resultados mais antigos
+            metrics.incr("mirror.fallbacks")
+            return None
+        return rows
+
+    def read_calendar(self, max_results: int, calendar_id: str = "primary"):
+        if calendar_id != self.calendar_id or not self._fresh("calendar"):
+            return None
+        return self.store.calendar_upcoming(max_results)
+
+    def read_drive(self, query: str, max_results: int):
+        name = drive_query_to_name(query)
+        if name is None:
+            metrics.incr("mirror.fallbacks")
+            return None
+        if not self._fresh("drive"):
+            return None
+        return self.store.drive_search(name, max_results)
+
+
+def main():
+    """Roda a sincronização contra respostas gravadas: python google_mirror.py fixture.json [--db espelho.sqlite]"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures", help="JSON com as respostas gravadas (MIRROR_RECORD)")
+    parser.add_argument("--db", default=MIRROR_PATH)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--sources", default=",".join(MIRROR_SOURCES))
+    args = parser.parse_args()
+
+    transport = FixtureTransport(args.fixtures)
+    engine = MirrorSync(transport, MirrorStore(args.db), sources=args.sources.split(","))
+    for i in range(args.rounds):
+        print(f"rodada {i + 1}: {asyncio.run(engine.sync_once())}")
+    print(f"{len(transport.calls)} chamada(s); {len(transport.records)} resposta(s) gravada(s) não usada(s)")
+
+
+if __name__ == "__main__":
+    main()
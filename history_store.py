@@ -0,0 +1,88 @@
+# history_store.py
+
+import json
+import os
+import threading
+
+# Tamanho máximo do log por contato antes de rotacionar, e quantos arquivos antigos manter
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(5 * 1024 * 1024)))
+HISTORY_BACKUPS = int(os.getenv("HISTORY_BACKUPS", "3"))
+TAIL_BLOCK_SIZE = 8192
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = threading.Lock()
+        return lock
+
+
+def tail_lines(path: str, n: int, block_size: int = TAIL_BLOCK_SIZE) -> list:
+    """
+    Retorna as últimas n linhas (bytes, sem o '\\n') lendo o arquivo de trás para frente.
+    O custo depende de n e do tamanho das linhas, não do tamanho do arquivo.
+    """
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # precisa de n+1 quebras para garantir n linhas completas
+        while pos > 0 and data.count(b"\n") <= n:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size) + data
+    lines = data.splitlines()
+    if pos > 0:
+        # a primeira linha lida pode estar cortada no meio
+        lines = lines[1:]
+    return [l for l in lines if l.strip()][-n:]
+
+
+def read_last_records(path: str, n: int) -> list:
+    """
+    Lê os últimos n registros JSON do log, incluindo arquivos rotacionados (path.1, path.2, ...)
+    se o atual não tiver registros suficientes. Ordem: do mais antigo ao mais recente.
+    """
+    records = []
+    for i in range(HISTORY_BACKUPS + 1):
+        if len(records) >= n:
+            break
+        p = path if i == 0 else f"{path}.{i}"
+        if not os.path.exists(p):
+            break
+        chunk = []
+        for line in tail_lines(p, n - len(records)):
+            try:
+                chunk.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        records = chunk + records
+    return records[-n:]
+
+
+def _rotate(path: str):
+    if HISTORY_BACKUPS <= 0:
+        os.remove(path)
+        return
+    for i in range(HISTORY_BACKUPS - 1, 0, -1):
+        src = f"{path}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+
+
+def append_record(path: str, entry: dict):
+    """Acrescenta um registro JSON ao log, rotacionando quando passa de HISTORY_MAX_BYTES."""
+    line = json.dumps(entry) + "\n"
+    with _lock_for(path):
+        if os.path.exists(path) and os.path.getsize(path) + len(line) > HISTORY_MAX_BYTES:
+            _rotate(path)
+        with open(path, "a") as f:
+            f.write(line)
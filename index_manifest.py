@@ -0,0 +1,144 @@
+# index_manifest.py
+
+import fcntl
+import hashlib
+import json
+import os
+
+# Manifesto dos arquivos indexados: caminho absoluto -> {size, mtime, sha256, doc_ids}
+MANIFEST_FILE = "file_manifest.json"
+# Arquivos do llama_index que definem o índice persistido
+INDEX_FILES = ("docstore.json", "index_store.json", "default__vector_store.json")
+LOCK_FILE = ".index.lock"
+
+
+def vector_store_signature(vector_store_dir: str):
+    """Assinatura (nome, mtime, tamanho) dos arquivos persistidos do índice; None se não existe."""
+    if not os.path.isdir(vector_store_dir):
+        return None
+    sig = []
+    for name in INDEX_FILES:
+        path = os.path.join(vector_store_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+class IndexWriteLock:
+    """
+    Lock entre processos (flock) para quem carrega, altera e persiste o índice
+    (build_vector_index nos servidores MCP e o ingestor de logs no app).
+    Com shared=True (LOCK_SH), leitores carregam o índice sem ver um persist pela metade.
+    """
+
+    def __init__(self, vector_store_dir: str, shared: bool = False):
+        self.path = os.path.join(vector_store_dir, LOCK_FILE)
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_files(data_dir: str) -> dict:
+    """
+    Lista os arquivos de data_dir (recursivo) com tamanho e mtime.
+    Arquivos e pastas ocultos ficam de fora, como no SimpleDirectoryReader (exclude_hidden=True).
+    """
+    files = {}
+    for root, dirs, names in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if name.startswith("."):
+                continue
+            path = os.path.abspath(os.path.join(root, name))
+            st = os.stat(path)
+            files[path] = {"size": st.st_size, "mtime": st.st_mtime_ns}
+    return files
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def manifest_from_docstore(docstore) -> dict:
+    """
+    Reconstrói um manifesto a partir do docstore de um índice antigo (sem manifesto).
+    Sem hash nem mtime: diff_manifest confirma pelo tamanho e calcula o hash na primeira execução.
+    """
+    manifest = {}
+    for ref_doc_id, info in docstore.get_all_ref_doc_info().items():
+        metadata = info.metadata or {}
+        path = metadata.get("file_path")
+        if not path:
+            continue
+        entry = manifest.setdefault(os.path.abspath(path), {
+            "size": metadata.get("file_size"), "mtime": None, "sha256": None, "doc_ids": [],
+        })
+        entry["doc_ids"].append(ref_doc_id)
+    return manifest
+
+
+def diff_manifest(manifest: dict, current: dict) -> dict:
+    """
+    Compara o manifesto com os arquivos atuais.
+    Tamanho e mtime iguais => inalterado sem ler o arquivo; caso contrário compara o sha256.
+    Retorna {"added", "changed", "removed", "unchanged"} (listas de caminhos) e "hashes"
+    com o sha256 calculado para arquivos novos/alterados.
+    """
+    added, changed, unchanged, hashes = [], [], [], {}
+    for path, info in current.items():
+        old = manifest.get(path)
+        if old is None:
+            added.append(path)
+            continue
+        if old.get("size") == info["size"] and old.get("mtime") == info["mtime"]:
+            unchanged.append(path)
+            continue
+        if old.get("size") != info["size"]:
+            changed.append(path)
+            continue
+        digest = hashes[path] = file_sha256(path)
+        # sha256 ausente: manifesto reconstruído do docstore, tamanho igual é aceito
+        if old.get("sha256") in (None, digest):
+            unchanged.append(path)
+        else:
+            changed.append(path)
+    removed = [p for p in manifest if p not in current]
+    return {"added": added, "changed": changed, "removed": removed, "unchanged": unchanged, "hashes": hashes}
@@ -0,0 +1,240 @@
+# log_ingester.py
+
+import asyncio
+import glob
+import json
+import os
+import time
+
+from embedding_pipeline import get_embedding_pipeline
+from embedding_store import export_binary_store
+from index_manifest import IndexWriteLock, vector_store_signature
+from metrics import metrics
+
+LOG_FOLDER = "logs"
+VECTOR_STORE_DIR = "vector_store"
+EMBED_MODEL = "text-embedding-ada-002"
+OFFSETS_FILE = os.path.join(VECTOR_STORE_DIR, "ingest_offsets.json")
+BRAIN_INGEST_INTERVAL = float(os.getenv("BRAIN_INGEST_INTERVAL", "5"))
+BRAIN_INGEST_TURNS = int(os.getenv("BRAIN_INGEST_TURNS", "4"))
+# cada gravação persiste o índice inteiro (e todo MCP server o recarrega): acumula os chunks
+BRAIN_INGEST_FLUSH_SECONDS = float(os.getenv("BRAIN_INGEST_FLUSH_SECONDS", "60"))
+BRAIN_INGEST_FLUSH_CHUNKS = int(os.getenv("BRAIN_INGEST_FLUSH_CHUNKS", "50"))
+
+
+def format_turn(record: dict) -> str:
+    """Uma interação (mensagem + resposta) como texto para embedding."""
+    ts = record.get("timestamp", "")
+    name = record.get("from_name") or record.get("from", "Usuário")
+    lines = []
+    if (record.get("user_message") or "").strip():
+        lines.append(f"[{ts}] {name} ({record.get('from', '')}): {record['user_message'].strip()}")
+    if (record.get("assistant_response") or "").strip():
+        lines.append(f"[{ts}] Arthur: {record['assistant_response'].strip()}")
+    return "\n".join(lines)
+
+
+class LogIngester:
+    """
+    Ingestão contínua dos logs do WhatsApp (logs/messages_*.log) no second brain.
+
+    A cada `interval` segundos:
+    - lê só os bytes novos de cada log a partir do offset salvo; se o log foi rotacionado, termina
+      de ler o arquivo antigo (.1) antes de recomeçar do 0 no novo;
+    - agrupa os registros em chunks de até `turns_per_chunk` interações da mesma conversa;
+    - embute os chunks pelo EmbeddingPipeline (lotes + cache) e os acumula em memória.
+
+    Persistir o índice custa O(corpus) aqui e em cada MCP server (que recarrega o índice), então
+    os chunks acumulados só são gravados a cada `flush_seconds` ou `flush_chunks` chunks: insere
+    os nós, persiste o índice e os offsets (ingest_offsets.json) sob o IndexWriteLock. Os offsets
+    em disco só avançam junto com o índice; se o processo cair antes, os trechos são relidos.
+
+    Um build_vector_index(full=True) apaga ingest_offsets.json junto com o índice: o ingestor
+    percebe e reingere os logs do início.
+
+    Os servidores MCP recarregam o índice sozinhos quando os arquivos persistidos mudam.
+    """
+
+    def __init__(self, log_dir: str = LOG_FOLDER, vector_store_dir: str = VECTOR_STORE_DIR,
+                 interval: float = BRAIN_INGEST_INTERVAL, turns_per_chunk: int = BRAIN_INGEST_TURNS,
+                 flush_seconds: float = BRAIN_INGEST_FLUSH_SECONDS, flush_chunks: int = BRAIN_INGEST_FLUSH_CHUNKS):
+        self.log_dir = log_dir
+        self.vector_store_dir = vector_store_dir
+        self.offsets_path = os.path.join(vector_store_dir, os.path.basename(OFFSETS_FILE))
+        self.interval = interval
+        self.turns_per_chunk = turns_per_chunk
+        self.flush_seconds = flush_seconds
+        self.flush_chunks = flush_chunks
+        # offsets: até onde já foi lido (inclui o que está pendente); _saved_offsets: o que está em disco
+        self.offsets = self._load_offsets()
+        self._saved_offsets = dict(self.offsets)
+        self._pending = []
+        self._pending_since = None
+        self._index = None
+        self._signature = None
+
+    def _load_offsets(self) -> dict:
+        if os.path.exists(self.offsets_path):
+            with open(self.offsets_path) as f:
+                return json.load(f)
+        return {}
+
+    def _save_offsets(self, offsets: dict):
+        tmp = self.offsets_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(offsets, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.offsets_path)
+        self._saved_offsets = dict(offsets)
+
+    def _read_from(self, path: str, offset: int, inode: int) -> tuple:
+        """Registros completos de `path` a partir de `offset`: ([(inode, offset, registro)], novo_offset)."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # só consome até a última linha completa
+        end = data.rfind(b"\n") + 1
+        records, pos = [], offset
+        for line in data[:end].splitlines(keepends=True):
+            try:
+                records.append((inode, pos, json.loads(line)))
+            except json.JSONDecodeError:
+                pass
+            pos += len(line)
+        return records, offset + end
+
+    def read_new_records(self) -> dict:
+        """Retorna {caminho: ([(inode, offset, registro)], novo_offset, inode)} dos logs com dados novos."""
+        found = {}
+        for path in sorted(glob.glob(os.path.join(self.log_dir, "messages_*.log"))):
+            st = os.stat(path)
+            saved = self.offsets.get(path, {})
+            offset = saved.get("offset", 0)
+            records = []
+            if saved and saved.get("inode") != st.st_ino:
+                # rotacionado: termina de ler o arquivo antigo (agora .1) a partir do offset salvo
+                rotated = f"{path}.1"
+                if os.path.exists(rotated) and os.stat(rotated).st_ino == saved.get("inode"):
+                    records, _ = self._read_from(rotated, offset, saved["inode"])
+                offset = 0
+            elif st.st_size < offset:
+                offset = 0  # truncado
+            if st.st_size > offset:
+                new_records, offset = self._read_from(path, offset, st.st_ino)
+                records += new_records
+            if records or saved.get("inode") != st.st_ino or saved.get("offset") != offset:
+                found[path] = (records, offset, st.st_ino)
+        return found
+
+    def build_nodes(self, path: str, records: list) -> list:
+        from llama_index.core.schema import TextNode
+
+        nodes = []
+        name = os.path.basename(path)
+        for i in range(0, len(records), self.turns_per_chunk):
+            group = records[i:i + self.turns_per_chunk]
+            text = "\n".join(t for t in (format_turn(r) for _, _, r in group) if t)
+            if not text:
+                continue
+            first, last = group[0][2], group[-1][2]
+            inode, offset = group[0][0], group[0][1]
+            nodes.append(TextNode(
+                # id determinístico: reprocessar o mesmo trecho sobrescreve em vez de duplicar;
+                # o inode separa os arquivos que recomeçam do offset 0 depois de uma rotação
+                id_=f"{name}:{inode}:{offset}",
+                text=text,
+                metadata={
+                    "source": "whatsapp",
+                    "file_name": name,
+                    "contact": first.get("from", ""),
+                    "from_name": first.get("from_name", ""),
+                    "start": first.get("timestamp", ""),
+                    "end": last.get("timestamp", ""),
+                },
+            ))
+        return nodes
+
+    def _load_index(self):
+        from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+
+        signature = vector_store_signature(self.vector_store_dir)
+        if self._index is not None and signature == self._signature:
+            return self._index
+        if os.path.exists(os.path.join(self.vector_store_dir, "docstore.json")):
+            self._index = load_index_from_storage(StorageContext.from_defaults(persist_dir=self.vector_store_dir))
+        else:
+            self._index = VectorStoreIndex([])
+        return self._index
+
+    def _rebuilt(self) -> bool:
+        """True (e zera o estado) se build_vector_index(full=True) apagou os offsets gravados."""
+        if not self._saved_offsets or os.path.exists(self.offsets_path):
+            return False
+        # o índice foi recriado do zero: recomeça a ingestão do início
+        self.offsets, self._saved_offsets = {}, {}
+        self._pending, self._pending_since = [], None
+        return True
+
+    def _commit(self, nodes: list, offsets: dict) -> bool:
+        """Insere os nós e grava os offsets. False se o índice foi recriado do zero nesse meio tempo."""
+        with IndexWriteLock(self.vector_store_dir):
+            if self._rebuilt():
+                return False
+            if nodes:
+                index = self._load_index()
+                index.insert_nodes(nodes)
+                index.storage_context.persist(self.vector_store_dir)
+                self._signature = vector_store_signature(self.vector_store_dir)
+                export_binary_store(self.vector_store_dir, EMBED_MODEL)
+            self._save_offsets(offsets)
+        return True
+
+    async def ingest_once(self, force: bool = False) -> int:
+        """
+        Lê e embute os dados novos de todos os logs; grava no índice quando o lote vence
+        (ou com `force`). Retorna o número de chunks gravados no índice.
+        """
+        self._rebuilt()
+        new = await asyncio.to_thread(self.read_new_records)
+        if new:
+            nodes = []
+            for path, (records, _, _) in new.items():
+                nodes.extend(self.build_nodes(path, records))
+            if nodes:
+                vectors = await get_embedding_pipeline(EMBED_MODEL).embed([n.get_content() for n in nodes])
+                for node, vector in zip(nodes, vectors):
+                    node.embedding = vector
+            self._pending.extend(nodes)
+            for path, (_, end, inode) in new.items():
+                self.offsets[path] = {"offset": end, "inode": inode}
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+
+        if self._pending_since is None:
+            return 0
+        due = (force or len(self._pending) >= self.flush_chunks
+               or time.monotonic() - self._pending_since >= self.flush_seconds)
+        return await self.flush() if due else 0
+
+    async def flush(self) -> int:
+        """Grava os chunks pendentes e os offsets. Retorna o número de chunks gravados."""
+        if self._pending_since is None:
+            return 0
+        start = time.perf_counter()
+        nodes = self._pending
+        if not await asyncio.to_thread(self._commit, nodes, dict(self.offsets)):
+            return 0
+        self._pending, self._pending_since = [], None
+
+        metrics.observe("ingest.batch", time.perf_counter() - start)
+        metrics.incr("ingest.chunks", len(nodes))
+        print(f"Ingestão de logs: {len(nodes)} chunk(s) gravados no índice")
+        return len(nodes)
+
+    async def run(self):
+        while True:
+            try:
+                await self.ingest_once()
+            except Exception as e:
+                metrics.incr("ingest.errors")
+                print(f"Erro na ingestão de logs: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,176 @@
+# mcp_pool.py
+
+import asyncio
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from agents.mcp import MCPServerStdio
+
+from metrics import metrics
+
+# Parâmetros do subprocesso MCP (server.py) compartilhados por todos os agentes
+SERVER_PARAMS = {
+    "command": "python",
+    "args": ["server.py"],
+    "env": os.environ.copy(),
+}
+
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_SPAWN_TIMEOUT = float(os.getenv("MCP_SPAWN_TIMEOUT", "60"))
+MCP_HEALTH_TIMEOUT = float(os.getenv("MCP_HEALTH_TIMEOUT", "5"))     # só para o ping de saúde
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "120"))        # por chamada de ferramenta
+
+
+class _PooledServer:
+    """
+    Um subprocesso MCP de vida longa.
+
+    O contexto do MCPServerStdio é aberto e fechado dentro de uma task dedicada,
+    pois os cancel scopes do anyio precisam ser encerrados na mesma task que os abriu.
+    """
+
+    def __init__(self, params: dict, name: str):
+        self.params = params
+        self.name = name
+        self.server = None
+        self.error = None
+        self._task = None
+        self._ready = None
+        self._stop = None
+
+    @property
+    def alive(self) -> bool:
+        return self.server is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float):
+        self.error = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"mcp-{self.name}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise
+        if self.error is not None:
+            raise self.error
+
+    async def _run(self):
+        try:
+            async with MCPServerStdio(
+                params=self.params,
+                name=self.name,
+                cache_tools_list=True,
+                # ferramentas lentas (build_vector_index, Gmail grande) não podem cair no timeout do ping
+                client_session_timeout_seconds=MCP_CALL_TIMEOUT,
+            ) as server:
+                self.server = server
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.server = None
+            self._ready.set()
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive or self.server.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.server.session.send_ping(), timeout)
+            return True
+        except Exception as e:
+            print(f"MCP {self.name} não respondeu ao health check: {e}")
+            return False
+
+    async def stop(self, timeout: float = 5.0):
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception:
+            pass
+        self._task = None
+        self.server = None
+
+
+class MCPServerPool:
+    """
+    Pool de sessões MCP (server.py) reaproveitadas entre mensagens.
+
+    - Os subprocessos são criados sob demanda, até `size` instâncias.
+    - Cada empréstimo faz um ping de health check; servidores mortos são reiniciados.
+    - Latências de spawn e de empréstimo vão para `metrics` (mcp.spawn / mcp.borrow).
+
+    O pool pertence a um único event loop; use get_mcp_pool() para obter o do loop atual.
+    """
+
+    def __init__(self, params: dict = None, size: int = MCP_POOL_SIZE):
+        self.params = params or SERVER_PARAMS
+        self.size = max(1, size)
+        self._slots = [_PooledServer(self.params, f"mcp_server_pi-{i}") for i in range(self.size)]
+        self._idle = asyncio.Queue()
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+        self._closed = False
+
+    async def _spawn(self, slot: _PooledServer):
+        restart = slot.error is not None or slot._task is not None
+        if restart:
+            await slot.stop()
+            metrics.incr("mcp.restarts")
+        start = time.perf_counter()
+        await slot.start(MCP_SPAWN_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        metrics.observe("mcp.spawn", elapsed)
+        metrics.incr("mcp.spawns")
+        print(f"MCP {slot.name} {'reiniciado' if restart else 'iniciado'} em {elapsed:.2f}s")
+
+    @asynccontextmanager
+    async def borrow(self):
+        """Empresta um MCPServerStdio conectado e saudável; devolve ao pool ao sair."""
+        if self._closed:
+            raise RuntimeError("MCPServerPool já foi encerrado")
+        start = time.perf_counter()
+        slot = await self._idle.get()
+        try:
+            if not await slot.ping(MCP_HEALTH_TIMEOUT):
+                await self._spawn(slot)
+        except BaseException:
+            self._idle.put_nowait(slot)
+            raise
+        metrics.observe("mcp.borrow", time.perf_counter() - start)
+        try:
+            yield slot.server
+        finally:
+            self._idle.put_nowait(slot)
+            metrics.gauge("mcp.idle", self._idle.qsize())
+
+    async def close(self):
+        self._closed = True
+        for slot in self._slots:
+            await slot.stop()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "alive": sum(1 for s in self._slots if s.alive),
+        }
+
+
+# Um pool por event loop: sessões MCP não podem atravessar loops diferentes
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_mcp_pool() -> MCPServerPool:
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = MCPServerPool(SERVER_PARAMS, size=MCP_POOL_SIZE)
+    return pool
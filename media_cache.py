@@ -0,0 +1,113 @@
+# media_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import metrics
+
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", os.path.join("cache", "media_results.sqlite"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+MEDIA_CACHE_TTL = float(os.getenv("MEDIA_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+class MediaResultCache:
+    """
+    Cache endereçado por conteúdo: sha256 dos bytes da mídia -> transcrição/descrição.
+
+    Mídia encaminhada entre chats e grupos tem os mesmos bytes, então a segunda ocorrência
+    não chama a OpenAI. Guardado em SQLite; entradas expiram após `ttl` segundos e, quando o
+    total passa de `max_bytes`, as menos acessadas recentemente são removidas.
+
+    Métricas: media_cache.hits / media_cache.misses / media_cache.evictions.
+    """
+
+    def __init__(self, path: str = MEDIA_CACHE_PATH, max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+                 ttl: float = MEDIA_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, kind TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind: str, data) -> str:
+        h = hashlib.sha256(kind.encode("utf-8") + b"\0")
+        h.update(data)
+        return h.hexdigest()
+
+    def get(self, kind: str, data):
+        key = self.key(kind, data)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                metrics.incr("media_cache.misses")
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        metrics.incr("media_cache.hits")
+        return row[0]
+
+    def put(self, kind: str, data, value: str):
+        key = self.key(kind, data)
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, kind, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        expired = self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,)).rowcount
+        evicted = max(expired, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            metrics.incr("media_cache.evictions", evicted)
+
+    def cached(self, kind: str, data, compute):
+        """
+        Retorna o resultado em cache para a mídia ou calcula com compute() e guarda.
+        compute() devolve None (ou "") em caso de falha: nada é guardado e a próxima vez tenta de novo.
+        """
+        value = self.get(kind, data)
+        if value is None:
+            value = compute()
+            if value:
+                self.put(kind, data, value)
+        return value
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MediaResultCache()
+        return _cache
@@ -0,0 +1,155 @@
+# media_prep.py
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from metrics import metrics
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele as imagens seguem sem redimensionar
+    Image = None
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG ou WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+VIDEO_KEYFRAMES = int(os.getenv("VIDEO_KEYFRAMES", "3"))
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "30"))
+
+# Tipos aceitos diretamente pela API de visão
+VISION_MIMETYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+
+def detect_mimetype(data) -> str:
+    """Detecta o tipo real pelos primeiros bytes (não confia no rótulo do WhatsApp)."""
+    head = bytes(data[:16])
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "image/heic"
+        return "video/mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "video/webm"
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    return "application/octet-stream"
+
+
+def prepare_image(data, max_edge: int = IMAGE_MAX_EDGE):
+    """
+    Reduz a imagem para no máximo max_edge pixels no maior lado e recodifica (JPEG/WEBP).
+    Retorna (bytes, mimetype). Mantém o original se já for menor e de tipo aceito.
+    Retorna None se o tipo não é aceito pela API de visão e não dá para recodificar
+    (PDF, HEIC sem plugin no Pillow, arquivo desconhecido).
+    """
+    mimetype = detect_mimetype(data)
+    original = (bytes(data), mimetype) if mimetype in VISION_MIMETYPES else None
+    if Image is None:
+        return original
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return original
+
+    small = max(img.size) <= max_edge
+    if small and mimetype in VISION_MIMETYPES:
+        return bytes(data), mimetype
+
+    img.thumbnail((max_edge, max_edge))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    encoded = out.getvalue()
+    if small and len(encoded) >= len(data) and mimetype in VISION_MIMETYPES:
+        return bytes(data), mimetype
+    return encoded, f"image/{IMAGE_FORMAT.lower()}"
+
+
+def _video_duration(path: str):
+    """Duração do vídeo em segundos pelo ffprobe, ou None se não for possível obter."""
+    if shutil.which("ffprobe") is None:
+        return None
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT, check=True).stdout
+        duration = float(out.strip())
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
+    return duration if duration > 0 else None
+
+
+def extract_keyframes(data, count: int = VIDEO_KEYFRAMES, max_edge: int = IMAGE_MAX_EDGE) -> list:
+    """
+    Extrai até `count` quadros espalhados pela duração do vídeo com ffmpeg, já reduzidos para max_edge.
+    Sem ffprobe (duração desconhecida), usa os primeiros keyframes (I-frames).
+    Retorna lista de bytes JPEG (vazia se o ffmpeg não estiver disponível).
+    """
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg não encontrado; vídeo não será analisado por keyframes")
+        return []
+    scale = f"scale='if(gt(iw,ih),min({max_edge},iw),-2)':'if(gt(iw,ih),-2,min({max_edge},ih))'"
+    # MP4 precisa de seek (moov pode estar no fim), então o vídeo vai para um arquivo temporário
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        duration = _video_duration(tmp.name)
+        if duration:
+            # um quadro a cada duration/count segundos: cobre o vídeo inteiro, não só o começo
+            sample = f"fps={count}/{duration:.3f}"
+        else:
+            sample = "select='eq(pict_type,I)'"
+        cmd = [
+            "ffmpeg", "-loglevel", "error", "-i", tmp.name,
+            "-vf", f"{sample},{scale}", "-vsync", "vfr",
+            "-frames:v", str(count), "-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", "5", "pipe:1",
+        ]
+        try:
+            out = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT, check=True).stdout
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"Falha ao extrair keyframes: {e}")
+            return []
+    # saída mjpeg: JPEGs concatenados, cada um começando com FFD8FF
+    frames = [b"\xff\xd8\xff" + part for part in out.split(b"\xff\xd8\xff") if part]
+    return frames[:count]
+
+
+def prepare_media(data, msg_type: str = "image") -> list:
+    """
+    Prepara a mídia para a chamada de visão. Retorna [(bytes, mimetype)]:
+    uma imagem reduzida, ou alguns quadros no caso de vídeo; vazia se nada puder ir para a API.
+    Registra bytes economizados (media.bytes_in/out/saved) e latência (media.prep.*).
+    """
+    start = time.perf_counter()
+    mimetype = detect_mimetype(data)
+    if msg_type == "video" or mimetype.startswith("video/"):
+        stage = "video"
+        parts = [(frame, "image/jpeg") for frame in extract_keyframes(data)]
+    else:
+        stage = "image"
+        image = prepare_image(data)
+        parts = [image] if image is not None else []
+    elapsed = time.perf_counter() - start
+
+    size_in = len(data)
+    size_out = sum(len(p) for p, _ in parts)
+    metrics.observe(f"media.prep.{stage}", elapsed)
+    metrics.incr("media.bytes_in", size_in)
+    metrics.incr("media.bytes_out", size_out)
+    metrics.incr("media.bytes_saved", max(size_in - size_out, 0))
+    print(f"Mídia ({stage}, {mimetype}): {size_in // 1024} KB -> {size_out // 1024} KB "
+          f"em {len(parts)} parte(s), {elapsed * 1000:.0f} ms")
+    return parts
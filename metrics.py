@@ -0,0 +1,79 @@
+# metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyStat:
+    """Acumula contagem, total, máximo e último valor (em segundos) de uma métrica."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+            "last_ms": round(self.last * 1000, 1),
+        }
+
+
+class Metrics:
+    """
+    Registro simples de latências, contadores e medidores (gauges) do processo.
+    Thread-safe: usado tanto pelas threads do Flask quanto pelo loop asyncio.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            stat = self._latencies.get(name)
+            if stat is None:
+                stat = self._latencies[name] = LatencyStat()
+            stat.observe(seconds)
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "latencies": {k: v.snapshot() for k, v in sorted(self._latencies.items())},
+                "counters": dict(sorted(self._counters.items())),
+                "gauges": dict(sorted(self._gauges.items())),
+            }
+
+
+# Instância global do processo
+metrics = Metrics()
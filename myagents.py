@@ -1,10 +1,12 @@
 import datetime
 import os
 import json
-from agents import Agent, Runner, gen_trace_id, trace, WebSearchTool
+from agents import Agent, Runner, RunHooks, gen_trace_id, trace, WebSearchTool
 from agents.model_settings import ModelSettings
-from agents.mcp import MCPServerStdio
 
+from mcp_pool import get_mcp_pool
+from history_store import read_last_records
+from cache import ConversationCache
 
 
 # Diretório de logs persistidos
@@ -13,55 +15,62 @@ LOG_FOLDER = "logs"
 def load_persisted_history(chat_id: str, max_msgs: int = 5):
     """
     Lê as últimas max_msgs interações do arquivo logs/messages_{chat_id}.log
+    (lendo só o final do arquivo, sem carregar o log inteiro).
     Retorna lista de tuplas (role, message).
     """
     path = os.path.join(LOG_FOLDER, f"messages_{chat_id}.log")
-    if not os.path.exists(path):
-        return []
     history = []
-    with open(path, encoding="utf-8") as f:
-        lines = f.readlines()[-max_msgs:]
-    for line in lines:
-        try:
-            entry = json.loads(line)
-            u = entry.get("user_message", "").strip()
-            a = entry.get("assistant_response", "").strip()
-            from_name = entry.get("from_name", "Usuário")
-            timestamp = entry.get("timestamp", "")
-            msg_type = entry.get("type", "chat")
-            if u:
-                history.append(("User", u, from_name, msg_type, timestamp))
-            if a:
-                history.append(("Assistant", a, "Arthur", "chat", timestamp))
-
-        except json.JSONDecodeError:
-            continue
+    for entry in read_last_records(path, max_msgs):
+        u = entry.get("user_message", "").strip()
+        a = entry.get("assistant_response", "").strip()
+        from_name = entry.get("from_name", "Usuário")
+        timestamp = entry.get("timestamp", "")
+        msg_type = entry.get("type", "chat")
+        if u:
+            history.append(("User", u, from_name, msg_type, timestamp))
+        if a:
+            history.append(("Assistant", a, "Arthur", "chat", timestamp))
     return history
 
-# Histórico de conversas por chat (memória volátil)
-conversation_history = {}
+# Histórico de conversas por chat (memória volátil, limitada: LRU + turnos por contato + TTL)
+conversation_history = ConversationCache()
 
-# Parâmetros do subprocesso MCP
-server_params = {
-    "command": "python",
-    "args": ["server.py"],
-    "env": os.environ.copy(),
-}
+# Ferramentas MCP com efeito fora da conversa (envios, criação de eventos, reindexação,
+# compartilhamento público de arquivos do Drive)
+MUTATING_TOOLS = {"sendwhats", "send_gmail", "create_calendar_event", "build_vector_index",
+                  "download_drive_file", "make_file_public"}
 
-async def process_llm(mensagem: str, nome_remetente: str, remetente: str):
-    # 1) Carrega histórico persistido em disco
-    persisted = load_persisted_history(remetente, max_msgs=5)
-    # Inicializa memória em RAM com histórico persistido, se primeira vez
-    if remetente not in conversation_history:
-        conversation_history[remetente] = persisted.copy()
+class SideEffectHooks(RunHooks):
+    """Chama `on_side_effect` antes de o agente executar uma ferramenta de MUTATING_TOOLS."""
 
-    async with MCPServerStdio(params=server_params) as mcp_server:
+    def __init__(self, on_side_effect):
+        self.on_side_effect = on_side_effect
+
+    async def on_tool_start(self, context, agent, tool):
+        if tool.name in MUTATING_TOOLS:
+            self.on_side_effect()
+
+async def process_llm(mensagem: str, nome_remetente: str, remetente: str, on_side_effect=None):
+    """
+    Gera a resposta do agente para a mensagem. `on_side_effect` (opcional) é chamado antes da
+    primeira ferramenta que envia ou altera algo (a fila de coalescência deixa de cancelar a geração).
+    """
+    # 1) Inicializa memória em RAM com histórico persistido em disco, se não estiver em cache
+    # (um único get por mensagem: os contadores de hit/miss do /stats contam mensagens)
+    historico = conversation_history.get(remetente)
+    if historico is None:
+        historico = load_persisted_history(remetente, max_msgs=5)
+        conversation_history.set(remetente, historico)
+
+    # Empresta uma sessão MCP já aberta do pool (evita subir server.py a cada mensagem)
+    async with get_mcp_pool().borrow() as mcp_server:
         # Atualiza o histórico da conversa para esse chat
 
+        # O turno do usuário só entra no cache junto com a resposta: se a geração for
+        # cancelada (coalescência de mensagens), o histórico não fica com entrada duplicada
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conversation_history[remetente].append(
-            ("User", mensagem, nome_remetente, "chat", now)
-        )
+        user_turn = ("User", mensagem, nome_remetente, "chat", now)
+        recentes = list(historico) + [user_turn]
 
         #conversation_history[remetente].append(("User", mensagem))
 
@@ -71,7 +80,7 @@ async def process_llm(mensagem: str, nome_remetente: str, remetente: str):
 
         historical = "\n".join(
             f"{role} ({name}, {ts}, {msg_type}): {msg}"
-            for role, msg, name, msg_type, ts in conversation_history[remetente][-3:]
+            for role, msg, name, msg_type, ts in recentes[-3:]
         )
         
         SYSTEM_PROMPT = (   
@@ -83,7 +92,7 @@ async def process_llm(mensagem: str, nome_remetente: str, remetente: str):
             "Sempre utilize automaticamente qualquer ferramenta disponível para obter informações ou executar ações que vão além do seu conhecimento fixo, sem pedir permissão ao usuário. "
             "Ferramentas disponíveis:\n"
             "- Google Drive: listar, buscar, obter link de download, criar pastas, enviar e deletar arquivos.\n"
-            "- Gmail: buscar, ler e enviar e-mails.\n"
+            "- Gmail: buscar, listar (assunto, remetente e trecho), ler e enviar e-mails.\n"
             "- Google Calendar: listar, criar e obter detalhes de eventos.\n"
             "- Clima: previsão e condições atuais de qualquer cidade.\n"
             "- WhatsApp: enviar mensagens para qualquer número autorizado.\n"
@@ -91,6 +100,8 @@ async def process_llm(mensagem: str, nome_remetente: str, remetente: str):
             "- search_brain: buscar informações relevantes em arquivos, históricos de WhatsApp, e-mails e documentos indexados.\n"
             "- build_vector_index: (uso restrito) atualizar ou reconstruir a base de conhecimento vetorial quando solicitado.\n"
 
+            "Para ver vários e-mails de uma vez (ex.: 'quais meus últimos e-mails', 'tem e-mail de fulano?'), use 'list_gmail', "
+            "que traz assunto, remetente e trecho de cada mensagem numa única chamada; use 'get_gmail' só para ler o corpo de uma mensagem específica. "
             "Use a ferramenta 'search_brain' sempre que precisar buscar mensagens anteriores, documentos especificos que não estejam no contexto recente da conversa. "
             "Não use a função 'build_vector_index' automaticamente — só execute quando explicitamente solicitado pelo usuário, como 'Atualize a base vetorial' ou 'Reindexe os arquivos para memoria'. "
 
@@ -125,14 +136,16 @@ async def process_llm(mensagem: str, nome_remetente: str, remetente: str):
 
         # Processa a query com o agente (usando trace para log, se desejar)
         with trace("Agent interaction", trace_id=gen_trace_id()):
-            result = await Runner.run(agent, mensagem)
+            hooks = SideEffectHooks(on_side_effect) if on_side_effect else None
+            result = await Runner.run(agent, mensagem, hooks=hooks)
         response_text = result.final_output
 
         # Atualiza memória em RAM com a resposta
         #conversation_history[remetente].append(("Assistant", response_text))
         
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conversation_history[remetente].append(
+        conversation_history.append(remetente, user_turn)
+        conversation_history.append(remetente,
             ("Assistant", response_text, "Arthur", "chat", now)
         )
 
@@ -0,0 +1,147 @@
+# rate_limit.py
+
+import threading
+import time
+
+from metrics import metrics
+
+RATE_POLICIES = ("queue", "shed", "reply")
+RATE_MAX_BUCKETS = 2000
+RATE_REPLY_COOLDOWN = 60.0
+
+
+class TokenBucket:
+    """
+    Token bucket com reserva: `rate_per_minute` tokens por minuto, rajada até `burst`.
+    Reservar com saldo insuficiente deixa o saldo negativo; a próxima mensagem espera mais.
+    Não é thread-safe sozinho (o AdmissionControl faz o lock).
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos até haver um token disponível (0 se já há)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self):
+        self.tokens -= 1
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionControl:
+    """
+    Limites de taxa por contato, por grupo e global para as mensagens que o bot vai responder.
+
+    Cada mensagem consome um token do contato, do grupo (se for grupo) e do global; limite 0
+    desativa aquele nível. Acima do orçamento, a política decide:
+    - "queue": aceita e atrasa o processamento até haver token (até `max_wait` segundos, depois descarta);
+    - "shed": descarta a mensagem;
+    - "reply": descarta e manda uma resposta curta (no máximo uma a cada RATE_REPLY_COOLDOWN por chat).
+
+    Métricas: ratelimit.admitted / ratelimit.queued / ratelimit.rejected / ratelimit.replied /
+    ratelimit.refunded e ratelimit.delay (atraso imposto às mensagens enfileiradas).
+    """
+
+    def __init__(self, contact_rpm: float = 0, group_rpm: float = 0, global_rpm: float = 0,
+                 burst: int = 3, policy: str = "queue", max_wait: float = 60.0):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._replied = {}
+        self.configure(contact_rpm, group_rpm, global_rpm, burst, policy, max_wait)
+
+    def configure(self, contact_rpm: float, group_rpm: float, global_rpm: float,
+                  burst: int = 3, policy: str = "queue", max_wait: float = 60.0):
+        """Aplica novos limites (página de configuração); os buckets recomeçam cheios."""
+        with self._lock:
+            self.limits = {"contact": contact_rpm, "group": group_rpm, "global": global_rpm}
+            self.burst = burst
+            self.policy = policy if policy in RATE_POLICIES else "queue"
+            self.max_wait = max_wait
+            self._buckets.clear()
+
+    def _bucket(self, level: str, key: str):
+        rpm = self.limits[level]
+        if rpm <= 0:
+            return None
+        bucket = self._buckets.get((level, key))
+        if bucket is None:
+            if len(self._buckets) >= RATE_MAX_BUCKETS:
+                self._prune()
+            bucket = self._buckets[(level, key)] = TokenBucket(rpm, self.burst)
+        return bucket
+
+    def _prune(self):
+        # bucket cheio equivale a um novo: pode ser descartado
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[key]
+        for chat_id in [c for c, t in self._replied.items() if now - t >= RATE_REPLY_COOLDOWN]:
+            del self._replied[chat_id]
+
+    def admit(self, remetente: str, chat_id: str, is_group: bool):
+        """
+        Decide se a mensagem entra. Retorna (decisão, atraso):
+        ("ok", 0), ("queue", segundos a esperar), ("shed", 0) ou ("reply", 0).
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = [self._bucket("contact", remetente), self._bucket("global", "*")]
+            if is_group:
+                buckets.append(self._bucket("group", chat_id))
+            buckets = [b for b in buckets if b is not None]
+            delay = max((b.wait_time(now) for b in buckets), default=0.0)
+
+            if delay > 0 and (self.policy != "queue" or delay > self.max_wait):
+                metrics.incr("ratelimit.rejected")
+                if self.policy == "reply" and now - self._replied.get(chat_id, -RATE_REPLY_COOLDOWN) >= RATE_REPLY_COOLDOWN:
+                    self._replied[chat_id] = now
+                    metrics.incr("ratelimit.replied")
+                    return "reply", 0.0
+                return "shed", 0.0
+
+            for b in buckets:
+                b.reserve()
+        if delay > 0:
+            metrics.incr("ratelimit.queued")
+            metrics.observe("ratelimit.delay", delay)
+            return "queue", delay
+        metrics.incr("ratelimit.admitted")
+        return "ok", 0.0
+
+    def refund(self, remetente: str, chat_id: str, is_group: bool):
+        """Devolve o token de uma mensagem admitida que não foi aceita depois (ex.: fila cheia)."""
+        with self._lock:
+            keys = [("contact", remetente), ("global", "*")]
+            if is_group:
+                keys.append(("group", chat_id))
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.refund()
+        metrics.incr("ratelimit.refunded")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limits_per_minute": dict(self.limits),
+                "burst": self.burst,
+                "policy": self.policy,
+                "max_wait": self.max_wait,
+                "buckets": len(self._buckets),
+            }
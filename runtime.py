@@ -0,0 +1,72 @@
+# runtime.py
+
+import asyncio
+import atexit
+import threading
+
+from mcp_pool import get_mcp_pool
+
+
+class AppRuntime:
+    """
+    Event loop único e de vida longa rodando numa thread daemon.
+
+    O Flask (síncrono) entrega corrotinas com run()/submit() em vez de chamar
+    asyncio.run() a cada webhook. Assim o cliente OpenAI/agents, o pool MCP e os
+    clientes HTTP assíncronos ficam vivos entre mensagens e reaproveitam conexões.
+    """
+
+    def __init__(self, name: str = "app-runtime"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self.loop is not None:
+                return self.loop
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_run, name=self.name, daemon=True)
+            self._thread.start()
+            started.wait()
+            self.loop = loop
+            atexit.register(self.stop)
+            return loop
+
+    def submit(self, coro):
+        """Agenda a corrotina no loop compartilhado; retorna um concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro, timeout: float = None):
+        """Executa a corrotina no loop compartilhado e bloqueia até o resultado."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            loop = self.loop
+            if loop is None:
+                return
+            self.loop = None
+        try:
+            # encerra os subprocessos MCP antes de parar o loop
+            asyncio.run_coroutine_threadsafe(_close_mcp_pool(), loop).result(timeout)
+        except Exception as e:
+            print(f"Falha ao encerrar pool MCP: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+
+
+async def _close_mcp_pool():
+    await get_mcp_pool().close()
+
+
+# Runtime global do processo
+runtime = AppRuntime()
@@ -1,32 +1,43 @@
 #mcp server.py
 import datetime
+import time
 from mcp.server.fastmcp import FastMCP
 import httpx
 import os
+import sys
 from dotenv import load_dotenv
 import json
 from collections import defaultdict
-import requests
+
+# antes dos módulos locais: eles leem as configurações (GOOGLE_*, EMBED_*, BRAIN_*...) no import
+load_dotenv()
+
+from waha_client import waha
+from weather_client import weather
+from google_exec import google_exec
+from gmail_mime import extract_body
+from google_credentials import build_service, credentials
+from google_mirror import (GOOGLE_MIRROR, MIRROR_RECORD, ApiTransport, MirrorStore, MirrorSync,
+                           RecordingTransport)
+from metrics import metrics
 
 
 # Google API imports
 import asyncio
 import base64
 from typing import List, Dict, Literal
-from dotenv import load_dotenv
 from email.mime.text import MIMEText
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-
-# LlamaIndex imports vector store
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, load_index_from_storage
-import glob
-from llama_index.embeddings.openai import OpenAIEmbedding
-
-load_dotenv()
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+# As bibliotecas do Google (google_credentials) e o llama_index são importados sob demanda:
+# o servidor sobe e lista as ferramentas sem carregá-los.
+
+# Vector store
+from embedding_store import BRAIN_STORE_FORMAT, MMAP_STORE_DIR, export_binary_store, get_embedding_store
+from vector_search import MatrixSearch
+from embedding_pipeline import get_embedding_pipeline
+from log_ingester import OFFSETS_FILE
+from index_manifest import (MANIFEST_FILE, IndexWriteLock, diff_manifest, file_sha256, load_manifest,
+                            manifest_from_docstore, save_manifest, scan_files, vector_store_signature)
+import numpy as np
 
 # Google API credentials
 GMAIL_CREDENTIALS = os.getenv('GMAIL_CREDENTIALS_JSON', 'credentials.json')
@@ -36,6 +47,10 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.send',
 ]
 
+# Requisições por lote no endpoint batch do Gmail (a API aceita até 100; recomenda até 50)
+GMAIL_BATCH_SIZE = int(os.getenv('GMAIL_BATCH_SIZE', '50'))
+GMAIL_METADATA_HEADERS = ['Subject', 'From', 'Date']
+
 CAL_CREDENTIALS = os.getenv('GOOGLE_CAL_CREDENTIALS_JSON', GMAIL_CREDENTIALS)
 CAL_TOKEN = os.getenv('GOOGLE_CAL_TOKEN_JSON', 'cal_token.json')
 CAL_SCOPES = [
@@ -58,152 +73,215 @@ mcp = FastMCP("mcp_server_pi")
 @mcp.tool()
 async def fetch_weather(city: str) -> str:
     """Fetch current weather for a city"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"https://api.openweathermap.org/data/2.5/weather?q={city}&APPID={OPENWEATHER_API_KEY}&units=metric")
-        result = response.text
-        weather_data = json.loads(result)
-        current_weather = (
-            f"Agora em {city.capitalize()}: {weather_data['main']['temp']}°C, "
-            f"{weather_data['weather'][0]['description'].capitalize()}, "
-            f"umidade de {weather_data['main']['humidity']}% e vento de {weather_data['wind']['speed']} m/s."
-        )
-        
-        return current_weather
+    # cliente compartilhado com cache TTL por cidade (WEATHER_TTL)
+    weather_data = await weather.current(city)
+    current_weather = (
+        f"Agora em {city.capitalize()}: {weather_data['main']['temp']}°C, "
+        f"{weather_data['weather'][0]['description'].capitalize()}, "
+        f"umidade de {weather_data['main']['humidity']}% e vento de {weather_data['wind']['speed']} m/s."
+    )
+
+    return current_weather
 
 
 @mcp.tool()
 async def fetch_forecast(city: str, days: int) -> str:
     """Fetch current weather for a city"""
-    async with httpx.AsyncClient() as client:
-        # Calcula o cnt necessário (8 previsões a cada dia, com intervalos de 3h)
-        cnt = days * 8
-        
-        response = await client.get(f"https://api.openweathermap.org/data/2.5/forecast?q={city}&cnt={cnt}&APPID={OPENWEATHER_API_KEY}&units=metric")
-        result = response.text
-
-        forecast_data = json.loads(result)
-        forecast_list = forecast_data.get('list', [])
-        
-        if forecast_list:
-            # Agrupa as previsões por data (YYYY-MM-DD)
-            daily_temps = defaultdict(list)
-            for forecast in forecast_list:
-                dt_txt = forecast.get('dt_txt', '')
-                date = dt_txt.split(" ")[0] if dt_txt else "Data desconhecida"
-                temp_min = forecast['main']['temp_min']
-                temp_max = forecast['main']['temp_max']
-                daily_temps[date].append((temp_min, temp_max))
-            
-            daily_summary = []
-            # Ordena as datas e calcula, para cada dia, o mínimo e máximo
-            for date in sorted(daily_temps.keys()):
-                temps = daily_temps[date]
-                day_min = min(t[0] for t in temps)
-                day_max = max(t[1] for t in temps)
-                daily_summary.append(f"{date}: Mín {day_min}°C, Máx {day_max}°C")
-                
-            forecast_summary = (
-                f"Previsão para {city.capitalize()} para os próximos {days} dia(s): " +
-                "; ".join(daily_summary) + "."
-            )
-            #print(forecast_summary)
-        else:
-            print("Não foi possível obter a previsão do tempo.")
-            
-        return forecast_summary
+    # A previsão completa de 5 dias fica em cache (FORECAST_TTL) e é recortada para
+    # days * 8 entradas (8 previsões por dia, com intervalos de 3h)
+    forecast_data = await weather.forecast(city, days)
+    forecast_list = forecast_data.get('list', [])
+
+    if forecast_list:
+        # Agrupa as previsões por data (YYYY-MM-DD)
+        daily_temps = defaultdict(list)
+        for forecast in forecast_list:
+            dt_txt = forecast.get('dt_txt', '')
+            date = dt_txt.split(" ")[0] if dt_txt else "Data desconhecida"
+            temp_min = forecast['main']['temp_min']
+            temp_max = forecast['main']['temp_max']
+            daily_temps[date].append((temp_min, temp_max))
+
+        daily_summary = []
+        # Ordena as datas e calcula, para cada dia, o mínimo e máximo
+        for date in sorted(daily_temps.keys()):
+            temps = daily_temps[date]
+            day_min = min(t[0] for t in temps)
+            day_max = max(t[1] for t in temps)
+            daily_summary.append(f"{date}: Mín {day_min}°C, Máx {day_max}°C")
+
+        forecast_summary = (
+            f"Previsão para {city.capitalize()} para os próximos {days} dia(s): " +
+            "; ".join(daily_summary) + "."
+        )
+        #print(forecast_summary)
+    else:
+        print("Não foi possível obter a previsão do tempo.", file=sys.stderr)
+        forecast_summary = "Não foi possível obter a previsão do tempo."
+
+    return forecast_summary
     
 @mcp.tool()
 async def sendwhats(msg: str, num: str) -> str:
-    url = "http://localhost:3000/api/sendText"
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "chatId": f"{num}@c.us",
-        "text": msg,
-        "session": "default"
-    }
-
-    response = requests.post(url, json=data, headers=headers)
-    print(response.json())
+    response = await waha.asend_text(f"{num}@c.us", msg)
+    print(response, file=sys.stderr)
     
-    return response.json()
+    return response
     
 
+class LazyService:
+    """
+    Constrói o serviço Google na primeira chamada de ferramenta e reaproveita depois.
+    A construção (credenciais + discovery em cache) roda numa thread, fora do event loop.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._lock = None
+
+    async def get(self):
+        if self._instance is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = await asyncio.to_thread(self.factory)
+                    metrics.observe(f"google.build.{self.factory.__name__}", time.perf_counter() - start)
+        return self._instance
+
 # ---------------------------- Gmail Service ----------------------------
 class GmailService:
     def __init__(self):
-        self.creds = None
-        if os.path.exists(GMAIL_TOKEN):
-            self.creds = Credentials.from_authorized_user_file(GMAIL_TOKEN, SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(GMAIL_CREDENTIALS, SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            with open(GMAIL_TOKEN, 'w') as token:
-                token.write(self.creds.to_json())
-        self.service = build('gmail', 'v1', credentials=self.creds)
-
-    def list_messages(self, query: str, max_results: int = 10) -> List[dict]:
-        res = self.service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
+        # credenciais compartilhadas (refresh em background) e discovery em cache local
+        self.creds = credentials.get(GMAIL_TOKEN, SCOPES, GMAIL_CREDENTIALS)
+        self.service = build_service('gmail', 'v1', self.creds)
+
+    # As chamadas .execute() bloqueiam: rodam no pool do google_exec, fora do event loop
+    async def list_messages(self, query: str, max_results: int = 10) -> List[dict]:
+        res = await google_exec.execute(
+            self.service.users().messages().list(userId='me', q=query, maxResults=max_results),
+            "gmail.list", self.creds)
         return res.get('messages', [])
 
-    def get_message(self, msg_id: str, fmt: str = 'full') -> dict:
-        return self.service.users().messages().get(userId='me', id=msg_id, format=fmt).execute()
-
-    def send_message(self, to: str, subject: str, body: str) -> dict:
+    async def get_message(self, msg_id: str, fmt: str = 'full') -> dict:
+        return await google_exec.execute(
+            self.service.users().messages().get(userId='me', id=msg_id, format=fmt),
+            "gmail.get", self.creds)
+
+    async def get_messages(self, msg_ids: List[str], fmt: str = 'metadata',
+                           headers: List[str] = GMAIL_METADATA_HEADERS) -> List[dict]:
+        """
+        Busca várias mensagens pelo endpoint batch (um round trip por GMAIL_BATCH_SIZE ids,
+        lotes em paralelo). fmt='metadata' traz só os cabeçalhos `headers` e o snippet.
+        Mantém a ordem dos ids; mensagens que falharem ficam de fora.
+        """
+        results = {}
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                metrics.incr("google.errors")
+                print(f"Falha ao buscar mensagem {request_id}: {exception}", file=sys.stderr)
+            else:
+                results[request_id] = response
+
+        async def run(chunk):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for msg_id in chunk:
+                params = {'userId': 'me', 'id': msg_id, 'format': fmt}
+                if fmt == 'metadata':
+                    params['metadataHeaders'] = headers
+                batch.add(self.service.users().messages().get(**params), request_id=msg_id)
+            await google_exec.execute(batch, "gmail.batch_get", self.creds)
+
+        chunks = [msg_ids[i:i + GMAIL_BATCH_SIZE] for i in range(0, len(msg_ids), GMAIL_BATCH_SIZE)]
+        await asyncio.gather(*(run(c) for c in chunks))
+        return [results[i] for i in msg_ids if i in results]
+
+    async def send_message(self, to: str, subject: str, body: str) -> dict:
         msg = MIMEText(body)
         msg['to'] = to
         msg['subject'] = subject
         raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-        return self.service.users().messages().send(userId='me', body={'raw': raw}).execute()
-
-# Helper para extrair corpo text/plain
-
-def extract_plain_text(payload: dict) -> str:
-    parts = payload.get('parts', [])
-    for part in parts:
-        if part.get('mimeType') == 'text/plain' and part.get('body', {}).get('data'):
-            data = base64.urlsafe_b64decode(part['body']['data'])
-            return data.decode('utf-8', errors='ignore')
-    return ''
+        return await google_exec.execute(
+            self.service.users().messages().send(userId='me', body={'raw': raw}),
+            "gmail.send", self.creds)
 
 # -----------------------------------------------------------------------
 
 # --- Ferramentas Gmail (baseado em google_workspace_mcp) ---
 
-gmail_service = GmailService()
+gmail_service = LazyService(GmailService)
+
+def _format_gmail_summary(msg_id: str, headers: dict, snippet: str) -> str:
+    return (
+        f"[{msg_id}] {headers.get('Date', '')}\n"
+        f"From: {headers.get('From')}\n"
+        f"Subject: {headers.get('Subject')}\n"
+        f"{snippet}"
+    )
 
 @mcp.tool()
 async def search_gmail(query: str, max_results: int = 5) -> str:
     """Busca IDs das mensagens no Gmail que atendem à query"""
-    msgs = gmail_service.list_messages(query, max_results)
+    mirror = get_mirror()
+    msgs = mirror.read_gmail(query, max_results) if mirror else None
+    if msgs is None:
+        gmail = await gmail_service.get()
+        msgs = await gmail.list_messages(query, max_results)
     if not msgs:
         return f"Nenhuma mensagem encontrada para '{query}'"
     return '\n'.join([m['id'] for m in msgs])
 
 @mcp.tool()
-async def get_gmail(query: str) -> str:
-    """Retorna assunto, remetente e corpo da primeira mensagem que atende à query"""
-    msgs = gmail_service.list_messages(query, 1)
+async def list_gmail(query: str, max_results: int = 5) -> str:
+    """Lista assunto, remetente, data e trecho das mensagens do Gmail que atendem à query"""
+    mirror = get_mirror()
+    cached = mirror.read_gmail(query, max_results) if mirror else None
+    if cached is not None:
+        if not cached:
+            return f"Nenhuma mensagem encontrada para '{query}'"
+        return "\n\n".join(_format_gmail_summary(m['id'], m, m['snippet']) for m in cached)
+
+    gmail = await gmail_service.get()
+    msgs = await gmail.list_messages(query, max_results)
     if not msgs:
         return f"Nenhuma mensagem encontrada para '{query}'"
-    msg = gmail_service.get_message(msgs[0]['id'], 'full')
-    headers = {h['name']: h['value'] for h in msg['payload'].get('headers', [])}
-    body = extract_plain_text(msg['payload'])
-    return (
-        f"Subject: {headers.get('Subject')}\n"
-        f"From: {headers.get('From')}\n\n"
-        f"{body}"
-    )
+    # só cabeçalhos + snippet, todas as mensagens num único batch
+    lines = []
+    for msg in await gmail.get_messages([m['id'] for m in msgs], 'metadata'):
+        headers = {h['name']: h['value'] for h in msg.get('payload', {}).get('headers', [])}
+        lines.append(_format_gmail_summary(msg['id'], headers, msg.get('snippet', '')))
+    return "\n\n".join(lines)
+
+@mcp.tool()
+async def get_gmail(query: str, max_results: int = 1) -> str:
+    """Retorna assunto, remetente e corpo das primeiras mensagens (padrão: 1) que atendem à query"""
+    gmail = await gmail_service.get()
+    msgs = await gmail.list_messages(query, max_results)
+    if not msgs:
+        return f"Nenhuma mensagem encontrada para '{query}'"
+    if len(msgs) == 1:
+        full = [await gmail.get_message(msgs[0]['id'], 'full')]
+    else:
+        full = await gmail.get_messages([m['id'] for m in msgs], 'full')
+    results = []
+    for msg in full:
+        headers = {h['name']: h['value'] for h in msg['payload'].get('headers', [])}
+        body = extract_body(msg['payload'])
+        results.append(
+            f"Subject: {headers.get('Subject')}\n"
+            f"From: {headers.get('From')}\n\n"
+            f"{body}"
+        )
+    return "\n\n---\n\n".join(results)
 
 @mcp.tool()
 async def send_gmail(to: str, subject: str, body: str) -> str:
     """Envia um e-mail via Gmail"""
-    sent = gmail_service.send_message(to, subject, body)
+    gmail = await gmail_service.get()
+    sent = await gmail.send_message(to, subject, body)
     return f"Email enviado ID: {sent.get('id')}"
 
 # ------------------------- End Gmail Service ------------------------
@@ -211,39 +289,37 @@ async def send_gmail(to: str, subject: str, body: str) -> str:
 # ------------------------- Calendar Service -------------------------
 class CalendarService:
     def __init__(self):
-        self.creds = None
-        if os.path.exists(CAL_TOKEN):
-            self.creds = Credentials.from_authorized_user_file(CAL_TOKEN, CAL_SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(CAL_CREDENTIALS, CAL_SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            with open(CAL_TOKEN, 'w') as t:
-                t.write(self.creds.to_json())
-        self.service = build('calendar', 'v3', credentials=self.creds)
+        self.creds = credentials.get(CAL_TOKEN, CAL_SCOPES, CAL_CREDENTIALS)
+        self.service = build_service('calendar', 'v3', self.creds)
 
-    def list_events(self, calendar_id: str = 'primary', max_results: int = 10) -> List[Dict]:
+    async def list_events(self, calendar_id: str = 'primary', max_results: int = 10) -> List[Dict]:
         now = datetime.datetime.utcnow().isoformat() + 'Z'
-        events = self.service.events().list(
+        events = (await google_exec.execute(self.service.events().list(
             calendarId=calendar_id, timeMin=now,
             maxResults=max_results, singleEvents=True,
             orderBy='startTime'
-        ).execute().get('items', [])
+        ), "calendar.list", self.creds)).get('items', [])
         return events
 
-    def get_event(self, calendar_id: str, event_id: str) -> Dict:
-        return self.service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+    async def get_event(self, calendar_id: str, event_id: str) -> Dict:
+        return await google_exec.execute(
+            self.service.events().get(calendarId=calendar_id, eventId=event_id),
+            "calendar.get", self.creds)
 
-    def create_event(self, calendar_id: str, event: Dict) -> Dict:
-        return self.service.events().insert(calendarId=calendar_id, body=event).execute()
+    async def create_event(self, calendar_id: str, event: Dict) -> Dict:
+        return await google_exec.execute(
+            self.service.events().insert(calendarId=calendar_id, body=event),
+            "calendar.insert", self.creds)
 
-calendar_service = CalendarService()
+calendar_service = LazyService(CalendarService)
 
 @mcp.tool()
 async def list_calendar_events(max_results: int = 5) -> str:
-    evs = calendar_service.list_events(max_results=max_results)
+    mirror = get_mirror()
+    evs = mirror.read_calendar(max_results) if mirror else None
+    if evs is None:
+        calendar = await calendar_service.get()
+        evs = await calendar.list_events(max_results=max_results)
     if not evs:
         return "Nenhum evento futuro encontrado."
     lines = []
@@ -254,7 +330,8 @@ async def list_calendar_events(max_results: int = 5) -> str:
 
 @mcp.tool()
 async def get_calendar_event(event_id: str, calendar_id: str = 'primary') -> str:
-    e = calendar_service.get_event(calendar_id, event_id)
+    calendar = await calendar_service.get()
+    e = await calendar.get_event(calendar_id, event_id)
     start = e['start'].get('dateTime', e['start'].get('date'))
     return f"{e['summary']}\nStart: {start}\nDescription: {e.get('description','')}"
 
@@ -271,7 +348,8 @@ async def create_calendar_event(calendar_id: str, summary: str, start: str, end:
     if attendees:
         event['attendees'] = [{'email': email} for email in attendees]
 
-    ev = calendar_service.create_event(calendar_id, event)
+    calendar = await calendar_service.get()
+    ev = await calendar.create_event(calendar_id, event)
     return f"Evento criado: {ev.get('id')}"
 
 # ------------------------- End Calendar Service -------------------------
@@ -279,41 +357,31 @@ async def create_calendar_event(calendar_id: str, summary: str, start: str, end:
 # google drive service
 class GoogleDriveService:
     def __init__(self):
-        self.creds = None
-        if os.path.exists(DRIVE_TOKEN):
-            self.creds = Credentials.from_authorized_user_file(DRIVE_TOKEN, DRIVE_SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(DRIVE_CREDENTIALS, DRIVE_SCOPES)
-                self.creds = flow.run_local_server(port=8080)
-            with open(DRIVE_TOKEN, 'w') as t:
-                t.write(self.creds.to_json())
-        self.service = build('drive', 'v3', credentials=self.creds)
-
-    def list_files(self, query: str = '', max_results: int = 10) -> List[Dict]:
-        results = self.service.files().list(
+        self.creds = credentials.get(DRIVE_TOKEN, DRIVE_SCOPES, DRIVE_CREDENTIALS, port=8080)
+        self.service = build_service('drive', 'v3', self.creds)
+
+    async def list_files(self, query: str = '', max_results: int = 10) -> List[Dict]:
+        results = await google_exec.execute(self.service.files().list(
             q=query,
             pageSize=max_results,
             fields="nextPageToken, files(id, name, mimeType, webViewLink)"
-        ).execute()
+        ), "drive.list", self.creds)
         return results.get('files', [])
     
-    def get_file(self, file_id: str) -> Dict:
+    async def get_file(self, file_id: str) -> Dict:
         """Get file metadata by ID, including shareable link"""
-        return self.service.files().get(
+        return await google_exec.execute(self.service.files().get(
             fileId=file_id, 
             fields='id, name, mimeType, webViewLink'
-        ).execute()
+        ), "drive.get", self.creds)
     
-    def make_file_public(self, file_id: str):
+    async def make_file_public(self, file_id: str):
         """Set file permission to anyone with the link can view"""
-        self.service.permissions().create(
+        await google_exec.execute(self.service.permissions().create(
             fileId=file_id,
             body={"role": "reader", "type": "anyone"},
             fields="id"
-        ).execute()
+        ), "drive.permissions", self.creds)
     
     
     def download_file(self, file_id: str) -> bytes:
@@ -323,12 +391,16 @@ class GoogleDriveService:
         return fh.content
     
 # ------------------------- Google Drive Service -------------------------
-drive_service = GoogleDriveService()
+drive_service = LazyService(GoogleDriveService)
 
 @mcp.tool()
 async def list_drive_files(query: str = '', max_results: int = 5) -> str:
     """List files in Google Drive matching the query"""
-    files = drive_service.list_files(query, max_results)
+    mirror = get_mirror()
+    files = mirror.read_drive(query, max_results) if mirror else None
+    if files is None:
+        drive = await drive_service.get()
+        files = await drive.list_files(query, max_results)
     if not files:
         return "Nenhum arquivo encontrado."
     lines = [f"{f['name']} (ID: {f['id']})" for f in files]
@@ -337,7 +409,8 @@ async def list_drive_files(query: str = '', max_results: int = 5) -> str:
 @mcp.tool()
 async def get_drive_file(file_id: str) -> str:
     """Get file metadata by ID"""
-    file_info = drive_service.get_file(file_id)
+    drive = await drive_service.get()
+    file_info = await drive.get_file(file_id)
     return f"Nome: {file_info['name']}\nID: {file_info['id']}\nTipo: {file_info['mimeType']}"
 
 # @mcp.tool()
@@ -357,9 +430,12 @@ async def get_drive_file(file_id: str) -> str:
 @mcp.tool()
 async def download_drive_file(file_id: str) -> str:
     """Return a shareable Google Drive link for the file"""
-    file_info = drive_service.get_file(file_id)
-    # Make sure the file is public
-    drive_service.make_file_public(file_id)
+    # metadados e permissão em paralelo (duas chamadas independentes)
+    drive = await drive_service.get()
+    file_info, _ = await asyncio.gather(
+        drive.get_file(file_id),
+        drive.make_file_public(file_id),
+    )
     link = file_info.get('webViewLink')
     if not link:
         return "Não foi possível gerar o link do arquivo."
@@ -367,6 +443,25 @@ async def download_drive_file(file_id: str) -> str:
 
 # ------------------------- End Google Drive Service -------------------------
 
+# ------------------------- Espelho local (Gmail/Calendar/Drive) -------------------------
+# Com GOOGLE_MIRROR=true, as ferramentas de listagem leem um SQLite sincronizado em background
+# (cursores incrementais da API) se ele tiver no máximo MIRROR_MAX_STALENESS segundos;
+# espelho frio/defasado ou consulta não suportada => chamada normal à API.
+_mirror = None
+_mirror_task = None
+
+def get_mirror():
+    global _mirror, _mirror_task
+    if not GOOGLE_MIRROR:
+        return None
+    if _mirror is None:
+        transport = ApiTransport({"gmail": gmail_service, "calendar": calendar_service, "drive": drive_service})
+        if MIRROR_RECORD:
+            transport = RecordingTransport(transport, MIRROR_RECORD)
+        _mirror = MirrorSync(transport, MirrorStore())
+        _mirror_task = asyncio.get_running_loop().create_task(_mirror.run())
+    return _mirror
+
 # --------------------------- MCP Dynamic Resource -------------------------
 
 # Add a dynamic greeting resource
@@ -382,6 +477,75 @@ def get_greeting(name: str) -> str:
 
 VECTOR_STORE_DIR = "vector_store"
 DATA_DIR = "data"  # coloque aqui logs, emails, pdfs, etc.
+EMBED_MODEL = "text-embedding-ada-002"
+_query_embedder = None
+
+# Índice residente em memória; recarregado só quando os arquivos persistidos mudam
+_brain_index = None
+_brain_signature = None
+_brain_lock = asyncio.Lock()
+
+def _vector_store_signature():
+    return vector_store_signature(VECTOR_STORE_DIR)
+
+class BrainIndex:
+    """Índice do llama_index + matriz NumPy com todos os embeddings para busca top-k vetorizada."""
+
+    def __init__(self, index):
+        self.index = index
+        data = getattr(index.vector_store, "data", None)
+        embedding_dict = getattr(data, "embedding_dict", None) or {}
+        self.node_ids = list(embedding_dict)
+        self.searcher = None
+        if embedding_dict:
+            self.searcher = MatrixSearch(np.array(list(embedding_dict.values()), dtype=np.float32))
+
+    def search(self, query_embedding, top_k: int) -> list:
+        idx, _ = self.searcher.search(query_embedding, top_k)
+        nodes = self.index.docstore.get_nodes([self.node_ids[i] for i in idx])
+        return [n.text for n in nodes]
+
+def _load_brain_index():
+    from llama_index.core import StorageContext, load_index_from_storage
+
+    # lock compartilhado: escritores (ingestor, build_vector_index) persistem com o lock exclusivo,
+    # então a leitura nunca pega um JSON gravado pela metade
+    with IndexWriteLock(VECTOR_STORE_DIR, shared=True):
+        signature = _vector_store_signature()
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=VECTOR_STORE_DIR))
+    return BrainIndex(index), signature
+
+def _persist_brain_index(index):
+    """Persiste o índice, publica-o como residente e exporta o formato binário, se ativo."""
+    index.storage_context.persist(VECTOR_STORE_DIR)
+    _publish_brain_index(index)
+    export_binary_store(VECTOR_STORE_DIR, EMBED_MODEL)
+
+def _publish_brain_index(index):
+    """Troca o índice residente de uma vez; consultas em andamento seguem com o anterior."""
+    global _brain_index, _brain_signature
+    _brain_index, _brain_signature = BrainIndex(index), _vector_store_signature()
+
+def _get_query_embedder(model: str = EMBED_MODEL):
+    from llama_index.embeddings.openai import OpenAIEmbedding
+
+    global _query_embedder
+    if _query_embedder is None or _query_embedder.model_name != model:
+        _query_embedder = OpenAIEmbedding(model_name=model)
+    return _query_embedder
+
+async def get_brain_index() -> BrainIndex:
+    """Retorna o índice residente, recarregando-o em background se o disco mudou."""
+    global _brain_index, _brain_signature
+    if _brain_index is not None and _vector_store_signature() == _brain_signature:
+        return _brain_index
+    async with _brain_lock:
+        if _brain_index is None or _vector_store_signature() != _brain_signature:
+            start = time.perf_counter()
+            index, signature = await asyncio.to_thread(_load_brain_index)
+            _brain_index, _brain_signature = index, signature
+            print(f"Índice vetorial carregado em {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return _brain_index
 
 @mcp.tool()
 async def build_vector_index(full: bool = True) -> str:
@@ -389,8 +553,10 @@ async def build_vector_index(full: bool = True) -> str:
     (Uso restrito/manual) Indexa arquivos da base de conhecimento vetorial.
 
     Esta ferramenta constrói ou atualiza o índice vetorial a partir dos arquivos presentes em DATA_DIR (como logs, e-mails, PDFs, etc).
-    - Use full=True para reindexar tudo do zero (apaga e recria o índice).
-    - Use full=False para indexação incremental (apenas novos arquivos).
+    - Use full=True para reindexar tudo do zero (apaga e recria o índice; as conversas do WhatsApp
+      são reindexadas em seguida pelo ingestor de logs).
+    - Use full=False para indexação incremental (embute apenas arquivos novos ou alterados,
+      remove os apagados; compara tamanho, mtime e sha256 com o manifesto de arquivos).
 
     ATENÇÃO: Esta função pode consumir recursos e gerar custos (caso use embeddings online).
     NÃO utilize esta ferramenta automaticamente. Só execute quando explicitamente solicitado pelo usuário, por exemplo: "Atualize a base vetorial" ou "Reindexe meus arquivos".
@@ -400,30 +566,97 @@ async def build_vector_index(full: bool = True) -> str:
 
     Retorna um resumo da operação de indexação realizada.
     """
-
-    embeddings = OpenAIEmbedding(model_name="text-embedding-ada-002") #add this line, if you are using openai models
-
-    if full or not os.path.exists(VECTOR_STORE_DIR):
+    # serializa com outros escritores do índice (ex.: ingestor de logs do app)
+    lock = IndexWriteLock(VECTOR_STORE_DIR)
+    await asyncio.to_thread(lock.acquire)
+    try:
+        return await _build_vector_index(full)
+    finally:
+        lock.release()
+
+async def _build_vector_index(full: bool) -> str:
+    from llama_index.core import SimpleDirectoryReader, StorageContext, VectorStoreIndex, load_index_from_storage
+    from llama_index.embeddings.openai import OpenAIEmbedding
+
+    embeddings = OpenAIEmbedding(model_name=EMBED_MODEL) #add this line, if you are using openai models
+    manifest_path = os.path.join(VECTOR_STORE_DIR, MANIFEST_FILE)
+    current = scan_files(DATA_DIR)
+
+    if full or not os.path.exists(os.path.join(VECTOR_STORE_DIR, "docstore.json")):
         # Indexação do zero
-        reader = SimpleDirectoryReader(input_dir=DATA_DIR, recursive=True)
+        reader = SimpleDirectoryReader(input_dir=DATA_DIR, recursive=True, filename_as_id=True)
         docs = reader.load_data()
-        print(f"Indexando {len(docs)} documentos...")
-        index = VectorStoreIndex.from_documents(docs, embeddings=embeddings)
-        index.storage_context.persist(VECTOR_STORE_DIR)
+        print(f"Indexando {len(docs)} documentos...", file=sys.stderr)
+        nodes = await _embed_documents(docs)
+        index = VectorStoreIndex(nodes, embed_model=embeddings)
+        manifest = _manifest_entries(current, docs, {})
+        _persist_brain_index(index)
+        save_manifest(manifest_path, manifest)
+        # o índice novo só tem DATA_DIR: zera os offsets para o ingestor do app reindexar os logs do WhatsApp
+        if os.path.exists(OFFSETS_FILE):
+            os.remove(OFFSETS_FILE)
         return f"Indexação completa: {len(docs)} documentos indexados."
     else:
-        # Incremental: só adiciona novos arquivos
-        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=VECTOR_STORE_DIR))
-        indexed_files = set(index.docstore.docs.keys())
-        all_files = glob.glob(os.path.join(DATA_DIR, "**"), recursive=True)
-        new_files = [f for f in all_files if os.path.isfile(f) and os.path.basename(f) not in indexed_files]
-        if not new_files:
-            return "Nenhum arquivo novo para indexar."
-        reader = SimpleDirectoryReader(input_files=new_files)
-        docs = reader.load_data()
-        index.insert_documents(docs, embeddings=embeddings)
-        index.storage_context.persist(VECTOR_STORE_DIR)
-        return f"Indexação incremental: {len(docs)} novos documentos adicionados."
+        # Incremental: só embute arquivos novos ou alterados e remove os apagados
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=VECTOR_STORE_DIR), embed_model=embeddings)
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            manifest = manifest_from_docstore(index.docstore)
+        diff = diff_manifest(manifest, current)
+        added, changed, removed = diff["added"], diff["changed"], diff["removed"]
+
+        for path in changed + removed:
+            for ref_doc_id in manifest[path].get("doc_ids", []):
+                index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            manifest.pop(path)
+
+        docs = []
+        if added or changed:
+            reader = SimpleDirectoryReader(input_files=added + changed, filename_as_id=True)
+            docs = reader.load_data()
+            index.insert_nodes(await _embed_documents(docs))
+
+        # inalterados também são atualizados (mtime novo / hash calculado), sem re-embutir
+        manifest = _manifest_entries({p: current[p] for p in added + changed + diff["unchanged"]}, docs, manifest, diff["hashes"])
+        if added or changed or removed:
+            _persist_brain_index(index)
+        save_manifest(manifest_path, manifest)
+
+        if not (added or changed or removed):
+            return "Nenhum arquivo novo, alterado ou removido para indexar."
+        return (
+            f"Indexação incremental: {len(added)} arquivo(s) novo(s), {len(changed)} alterado(s), "
+            f"{len(removed)} removido(s); {len(docs)} documentos embutidos."
+        )
+
+async def _embed_documents(docs):
+    """Quebra os documentos em nós e embute em lotes concorrentes, reaproveitando o cache em disco."""
+    from llama_index.core import Settings
+    from llama_index.core.schema import MetadataMode
+
+    nodes = Settings.node_parser.get_nodes_from_documents(docs)
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    vectors = await get_embedding_pipeline(EMBED_MODEL).embed(texts)
+    for node, vector in zip(nodes, vectors):
+        node.embedding = vector
+    return nodes
+
+def _manifest_entries(files: dict, docs, manifest: dict, hashes: dict = None) -> dict:
+    """Atualiza o manifesto com tamanho/mtime/sha256 dos arquivos e os ids dos documentos gerados."""
+    hashes = hashes or {}
+    doc_ids = {}
+    for doc in docs:
+        path = os.path.abspath(doc.metadata.get("file_path", ""))
+        doc_ids.setdefault(path, []).append(doc.doc_id)
+    for path, info in files.items():
+        entry = manifest.get(path, {})
+        manifest[path] = {
+            "size": info["size"],
+            "mtime": info["mtime"],
+            "sha256": hashes.get(path) or (entry.get("sha256") if path not in doc_ids else None) or file_sha256(path),
+            "doc_ids": doc_ids.get(path, entry.get("doc_ids", [])),
+        }
+    return manifest
 
 @mcp.tool()
 async def search_brain(query: str, top_k: int = 5) -> str:
@@ -448,8 +681,18 @@ async def search_brain(query: str, top_k: int = 5) -> str:
     Retorna um resumo dos textos/documentos mais relevantes encontrados.
 
     """
-    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=VECTOR_STORE_DIR))
-    retriever = index.as_retriever(similarity_top_k=top_k)
+    if BRAIN_STORE_FORMAT == "mmap" and os.path.exists(os.path.join(MMAP_STORE_DIR, "store.json")):
+        store = get_embedding_store(MMAP_STORE_DIR)
+        query_embedding = await _get_query_embedder(store.model or EMBED_MODEL).aget_query_embedding(query)
+        results = store.search(query_embedding, top_k)
+        return "\n---\n".join([node["text"] for _, node in results])
+
+    brain = await get_brain_index()
+    if brain.searcher is not None:
+        # um produto matriz-vetor + argpartition em vez de pontuar nó a nó
+        query_embedding = await _get_query_embedder().aget_query_embedding(query)
+        return "\n---\n".join(brain.search(query_embedding, top_k))
+    retriever = brain.index.as_retriever(similarity_top_k=top_k)
     results = retriever.retrieve(query)
     return "\n---\n".join([r.text for r in results])
 
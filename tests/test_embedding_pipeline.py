@@ -0,0 +1,51 @@
+# tests/test_embedding_pipeline.py
+
+import asyncio
+
+from embedding_pipeline import EmbeddingCache, EmbeddingPipeline, FakeEmbedder, RateLimiter
+
+
+def make_pipeline(tmp_path, embedder, **kwargs):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    return EmbeddingPipeline(embedder, cache, limiter=RateLimiter(60000, burst=10), **kwargs)
+
+
+def test_second_run_hits_cache_without_calling_embedder(tmp_path):
+    texts = [f"chunk {i}" for i in range(10)]
+    first = FakeEmbedder()
+    vectors = asyncio.run(make_pipeline(tmp_path, first).embed(texts))
+    assert first.texts == 10
+
+    # processo novo (outro pipeline) com o mesmo cache em disco
+    second = FakeEmbedder()
+    again = asyncio.run(make_pipeline(tmp_path, second).embed(texts))
+    assert second.calls == 0
+    assert [list(map(float, v)) for v in again] == [list(map(float, v)) for v in vectors]
+
+
+def test_only_new_chunks_are_embedded(tmp_path):
+    embedder = FakeEmbedder()
+    pipeline = make_pipeline(tmp_path, embedder)
+    asyncio.run(pipeline.embed(["a", "b"]))
+    asyncio.run(pipeline.embed(["a", "b", "c"]))
+    assert embedder.texts == 3
+
+
+def test_duplicates_are_embedded_once_and_order_is_kept(tmp_path):
+    embedder = FakeEmbedder()
+    vectors = asyncio.run(make_pipeline(tmp_path, embedder).embed(["x", "y", "x"]))
+    assert embedder.texts == 2
+    assert vectors[0] == vectors[2] != vectors[1]
+
+
+def test_batches_respect_batch_size(tmp_path):
+    embedder = FakeEmbedder()
+    asyncio.run(make_pipeline(tmp_path, embedder, batch_size=4).embed([str(i) for i in range(10)]))
+    assert embedder.calls == 3
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    asyncio.run(make_pipeline(tmp_path, FakeEmbedder(model="m1")).embed(["a"]))
+    other = FakeEmbedder(model="m2")
+    asyncio.run(make_pipeline(tmp_path, other).embed(["a"]))
+    assert other.calls == 1
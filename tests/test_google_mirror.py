@@ -0,0 +1,120 @@
+# tests/test_google_mirror.py
+
+import asyncio
+
+import pytest
+
+from google_mirror import FixtureTransport, MirrorStore, MirrorSync, gmail_query_to_sql
+
+
+def message(msg_id, subject, labels=("INBOX",), date=1):
+    return {
+        "id": msg_id, "threadId": msg_id, "internalDate": str(date), "snippet": f"trecho {msg_id}",
+        "labelIds": list(labels),
+        "payload": {"headers": [{"name": "Subject", "value": subject}, {"name": "From", "value": "ana@x.com"}]},
+    }
+
+
+def get(msg):
+    return {"call": "gmail.users.messages.get", "params": {"id": msg["id"]}, "response": msg}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = MirrorStore(str(tmp_path / "mirror.sqlite"))
+    yield s
+    s.close()
+
+
+def sync(transport, store, source):
+    return asyncio.run(MirrorSync(transport, store, sources=(source,)).sync_once())
+
+
+def search(store, query):
+    where, params = gmail_query_to_sql(query)
+    return [m["id"] for m in store.gmail_search(where, params, 10)]
+
+
+def test_gmail_full_then_incremental_history(store):
+    transport = FixtureTransport([
+        {"call": "gmail.users.getProfile", "response": {"historyId": "100"}},
+        {"call": "gmail.users.messages.list", "response": {"messages": [{"id": "a"}, {"id": "b"}]}},
+        get(message("a", "Olá", date=1)),
+        get(message("b", "Fatura", date=2)),
+        # rodada 2: parte do historyId salvo
+        {"call": "gmail.users.history.list", "params": {"startHistoryId": "100"}, "response": {
+            "historyId": "105",
+            "history": [
+                {"messagesAdded": [{"message": {"id": "c"}}]},
+                {"messagesDeleted": [{"message": {"id": "a"}}]},
+                {"labelsAdded": [{"message": {"id": "b", "labelIds": ["INBOX", "STARRED"]}}]},
+            ],
+        }},
+        get(message("c", "Reunião", date=3)),
+    ])
+    assert sync(transport, store, "gmail") == {"gmail": 2}
+    assert store.state("gmail")[0] == "100"
+
+    assert sync(transport, store, "gmail") == {"gmail": 3}
+    assert store.state("gmail")[0] == "105"
+    assert search(store, "") == ["c", "b"]
+    assert search(store, "is:starred") == ["b"]
+    assert transport.records == []
+
+
+def test_gmail_expired_history_falls_back_to_full_sync(store):
+    store.apply_gmail("50", [message("old", "Antiga")])
+    transport = FixtureTransport([
+        {"call": "gmail.users.history.list", "params": {"startHistoryId": "50"}, "status": 404},
+        {"call": "gmail.users.getProfile", "response": {"historyId": "200"}},
+        {"call": "gmail.users.messages.list", "response": {"messages": [{"id": "n"}]}},
+        get(message("n", "Nova")),
+    ])
+    assert sync(transport, store, "gmail") == {"gmail": 1}
+    assert store.state("gmail")[0] == "200"
+    assert search(store, "") == ["n"]
+
+
+def test_trashed_messages_are_hidden_unless_requested(store):
+    store.apply_gmail("1", [message("a", "ok"), message("t", "lixo", labels=("TRASH",))])
+    assert search(store, "") == ["a"]
+    assert search(store, "in:trash") == ["t"]
+
+
+def event(event_id, start, status="confirmed"):
+    return {"id": event_id, "status": status, "start": {"dateTime": start}, "end": {"dateTime": start}}
+
+
+def test_calendar_sync_token_and_expiry(store):
+    transport = FixtureTransport([
+        {"call": "calendar.events.list", "response": {
+            "items": [event("e1", "2099-01-01T10:00:00Z"), event("e2", "2099-01-02T10:00:00Z")],
+            "nextSyncToken": "tok1",
+        }},
+        {"call": "calendar.events.list", "params": {"syncToken": "tok1"}, "response": {
+            "items": [event("e1", "2099-01-01T10:00:00Z", status="cancelled")], "nextSyncToken": "tok2",
+        }},
+        {"call": "calendar.events.list", "params": {"syncToken": "tok2"}, "status": 410},
+        {"call": "calendar.events.list", "response": {"items": [event("e3", "2099-02-01T10:00:00Z")],
+                                                       "nextSyncToken": "tok3"}},
+    ])
+    sync(transport, store, "calendar")
+    assert store.state("calendar")[0] == "tok1"
+
+    sync(transport, store, "calendar")
+    assert store.state("calendar")[0] == "tok2"
+    assert [e["id"] for e in store.calendar_upcoming(10, now=0)] == ["e2"]
+
+    # 410: syncToken expirado => carga completa sem syncToken
+    sync(transport, store, "calendar")
+    assert store.state("calendar")[0] == "tok3"
+    assert [e["id"] for e in store.calendar_upcoming(10, now=0)] == ["e3"]
+    assert "syncToken" not in transport.calls[-1][1]
+
+
+def test_fresh_mirror_answers_reads_and_stale_falls_back(store):
+    engine = MirrorSync(FixtureTransport([]), store, max_staleness=60)
+    assert engine.read_gmail("", 5) is None  # nunca sincronizou
+    store.apply_gmail("1", [message("a", "Olá")])
+    assert [m["id"] for m in engine.read_gmail("from:ana", 5)] == ["a"]
+    assert engine.read_gmail("label:Trabalho", 5) is None  # label do usuário vai para a API
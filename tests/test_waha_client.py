@@ -0,0 +1,142 @@
+# tests/test_waha_client.py
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("requests")
+
+from waha_client import MediaTooLarge, WahaClient  # noqa: E402
+
+
+class FakeWaha:
+    """WAHA falso local: responde cada rota com os status programados (depois 200) e grava os pedidos."""
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = defaultdict(list)
+        self.media = b""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                fake.requests.append((self.path, json.loads(body or b"{}")))
+                queued = fake.statuses[self.path]
+                status = queued.pop(0) if queued else 200
+                self._reply(status, json.dumps({"status": status}).encode())
+
+            def do_GET(self):
+                fake.requests.append((self.path, None))
+                self._reply(200, fake.media)
+
+            def _reply(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake():
+    server = FakeWaha()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(fake):
+    c = WahaClient(base_url=fake.url, session="teste", timeout=5, retries=2, backoff=0)
+    yield c
+    c.close()
+
+
+def test_sync_post_retries_retryable_status(fake, client):
+    fake.statuses["/api/sendText"] = [503, 502]
+    assert client.send_text("123@c.us", "oi") == {"status": 200}
+    assert fake.paths() == ["/api/sendText"] * 3
+    assert fake.requests[0][1] == {"chatId": "123@c.us", "text": "oi", "session": "teste"}
+
+
+def test_async_post_retries_then_gives_up(fake, client):
+    import httpx
+
+    fake.statuses["/api/sendText"] = [503, 503, 503]
+
+    async def run():
+        try:
+            return await client.asend_text("123@c.us", "oi")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+    assert fake.paths() == ["/api/sendText"] * 3  # 1 + retries
+
+
+def test_async_post_does_not_retry_client_errors(fake, client):
+    import httpx
+
+    fake.statuses["/api/sendSeen"] = [400]
+
+    async def run():
+        try:
+            await client.asend_seen("123@c.us", "msg1")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+    assert fake.paths() == ["/api/sendSeen"]
+
+
+def test_typing_is_refreshed_and_stopped_after_work(fake, client):
+    async def run():
+        async with client.typing("123@c.us", refresh=0.05):
+            await asyncio.sleep(0.18)
+        await client.aclose()
+
+    asyncio.run(run())
+    paths = fake.paths()
+    assert paths.count("/api/startTyping") >= 3
+    assert paths[-1] == "/api/stopTyping"
+    assert paths.count("/api/stopTyping") == 1
+
+
+def test_typing_stops_even_if_work_fails(fake, client):
+    async def run():
+        try:
+            async with client.typing("123@c.us", refresh=10):
+                raise RuntimeError("falhou")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert fake.paths()[-1] == "/api/stopTyping"
+
+
+def test_fetch_media_stops_at_limit(fake, client):
+    fake.media = b"x" * 1000
+    assert client.fetch_media(f"{fake.url}/media/1").read() == fake.media
+    with pytest.raises(MediaTooLarge):
+        client.fetch_media(f"{fake.url}/media/2", max_bytes=100)
@@ -0,0 +1,75 @@
+# vector_search.py
+
+import numpy as np
+
+# Linhas convertidas por vez quando a matriz não é float32 (ex.: memmap float16)
+SCORE_BLOCK_ROWS = 8192
+
+
+class MatrixSearch:
+    """
+    Busca top-k vetorizada sobre uma matriz de embeddings (N x dim).
+
+    - Uma consulta custa um produto matriz-vetor + argpartition (O(N), sem ordenar tudo).
+    - normalize=True normaliza as linhas uma vez na construção, então o produto escalar
+      já é a similaridade de cosseno. Com normalize=False a matriz é usada como está
+      (útil para memmaps já normalizados no disco, evitando cópia para a RAM).
+    - A consulta é sempre normalizada (custo desprezível).
+    - search_batch() pontua várias consultas de uma vez (produto matriz-matriz).
+    """
+
+    def __init__(self, matrix, normalize: bool = True):
+        matrix = np.asarray(matrix)
+        if normalize and matrix.size:
+            matrix = matrix.astype(np.float32, copy=True)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def _prepare(self, queries) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return q / norms
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        """Produto (consultas x N). float16 não tem BLAS: converte em blocos para float32."""
+        if self.matrix.dtype == np.float32:
+            return q @ self.matrix.T
+        out = np.empty(q.shape[:-1] + (len(self),), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            out[..., start:start + len(block)] = q @ block.T
+        return out
+
+    def search(self, query, top_k: int = 5):
+        """Retorna (índices, scores) das top_k linhas mais similares, em ordem decrescente."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return _top_k(self._scores(self._prepare(query)), top_k)
+
+    def search_batch(self, queries, top_k: int = 5) -> list:
+        """Versão em lote: retorna uma lista de (índices, scores), uma por consulta."""
+        q = self._prepare(queries)
+        if q.ndim == 1:
+            q = q[None, :]
+        if not len(self):
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in q]
+        return [_top_k(row, top_k) for row in self._scores(q)]
+
+
+def _top_k(scores: np.ndarray, top_k: int):
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if k < scores.shape[0]:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.shape[0])
+    # ordena só os k candidatos
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return idx, scores[idx]
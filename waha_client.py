@@ -0,0 +1,237 @@
+# waha_client.py
+
+import asyncio
+import io
+import os
+import sys
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+WAHA_URL = os.getenv("WAHA_URL", "http://localhost:3000")
+WAHA_SESSION = os.getenv("WAHA_SESSION", "default")
+WAHA_TIMEOUT = float(os.getenv("WAHA_TIMEOUT", "10"))
+WAHA_RETRIES = int(os.getenv("WAHA_RETRIES", "3"))
+WAHA_BACKOFF = float(os.getenv("WAHA_BACKOFF", "0.5"))
+WAHA_POOL_SIZE = int(os.getenv("WAHA_POOL_SIZE", "10"))
+WAHA_TYPING_REFRESH = float(os.getenv("WAHA_TYPING_REFRESH", "5"))
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Status que indicam que o WAHA não processou o pedido; seguros para repetir
+RETRY_STATUS = (429, 502, 503, 504)
+
+
+class MediaTooLarge(Exception):
+    """Mídia maior que o limite configurado; o download é interrompido."""
+
+
+class WahaClient:
+    """
+    Cliente HTTP do WAHA com pool de conexões keep-alive, timeouts e retries com backoff.
+
+    - Métodos síncronos usam uma requests.Session compartilhada.
+    - Métodos assíncronos (prefixo "a") usam um httpx.AsyncClient por event loop.
+    - Erros de conexão e RETRY_STATUS são repetidos; timeouts de leitura não, para
+      não enviar a mesma mensagem duas vezes.
+
+    base_url é configurável (WAHA_URL), o que permite apontar para um WAHA falso local.
+    """
+
+    def __init__(self, base_url: str = WAHA_URL, session: str = WAHA_SESSION,
+                 timeout: float = WAHA_TIMEOUT, retries: int = WAHA_RETRIES,
+                 backoff: float = WAHA_BACKOFF, pool_size: int = WAHA_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.session_name = session
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+        self.http = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    # ------------------------- síncrono -------------------------
+
+    def post(self, path: str, payload: dict) -> dict:
+        r = self.http.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return _json_or_empty(r)
+
+    def send_text(self, chat_id: str, text: str, quoted_message_id: str = None) -> dict:
+        return self.post("/api/sendText", self._text_payload(chat_id, text, quoted_message_id))
+
+    def send_seen(self, chat_id: str, message_id: str, participant: str = None) -> dict:
+        return self.post("/api/sendSeen", self._seen_payload(chat_id, message_id, participant))
+
+    def start_typing(self, chat_id: str) -> dict:
+        return self.post("/api/startTyping", {"session": self.session_name, "chatId": chat_id})
+
+    def stop_typing(self, chat_id: str) -> dict:
+        return self.post("/api/stopTyping", {"session": self.session_name, "chatId": chat_id})
+
+    def fetch_media(self, url: str, max_bytes: int = MEDIA_MAX_BYTES) -> io.BytesIO:
+        """
+        Baixa a mídia em streaming direto para um buffer em memória (sem arquivo temporário).
+        Interrompe com MediaTooLarge assim que o tamanho passa de max_bytes.
+        """
+        with self.http.get(url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            length = r.headers.get("Content-Length")
+            if length and int(length) > max_bytes:
+                raise MediaTooLarge(f"mídia de {length} bytes excede o limite de {max_bytes}")
+            buf = io.BytesIO()
+            for chunk in r.iter_content(MEDIA_CHUNK_SIZE):
+                buf.write(chunk)
+                if buf.tell() > max_bytes:
+                    raise MediaTooLarge(f"mídia excede o limite de {max_bytes} bytes")
+        buf.seek(0)
+        return buf
+
+    # ------------------------- assíncrono -------------------------
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                # com transport explícito, o httpx ignora limits= do client: o pool é do transporte.
+                # retries do transporte cobrem apenas falhas de conexão
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.retries,
+                    limits=httpx.Limits(max_connections=self.pool_size,
+                                        max_keepalive_connections=self.pool_size),
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def apost(self, path: str, payload: dict) -> dict:
+        client = self._async_client()
+        for attempt in range(self.retries + 1):
+            r = await client.post(path, json=payload)
+            if r.status_code not in RETRY_STATUS or attempt == self.retries:
+                break
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+        r.raise_for_status()
+        return _json_or_empty(r)
+
+    async def asend_text(self, chat_id: str, text: str, quoted_message_id: str = None) -> dict:
+        return await self.apost("/api/sendText", self._text_payload(chat_id, text, quoted_message_id))
+
+    async def asend_seen(self, chat_id: str, message_id: str, participant: str = None) -> dict:
+        return await self.apost("/api/sendSeen", self._seen_payload(chat_id, message_id, participant))
+
+    async def astart_typing(self, chat_id: str) -> dict:
+        return await self.apost("/api/startTyping", {"session": self.session_name, "chatId": chat_id})
+
+    async def astop_typing(self, chat_id: str) -> dict:
+        return await self.apost("/api/stopTyping", {"session": self.session_name, "chatId": chat_id})
+
+    def typing(self, chat_id: str, refresh: float = WAHA_TYPING_REFRESH) -> "TypingIndicator":
+        """Indicador de digitação enquanto o bloco `async with` roda."""
+        return TypingIndicator(self, chat_id, refresh)
+
+    def background(self, coro) -> asyncio.Task:
+        """Dispara uma chamada sem bloquear o fluxo de resposta; erros só são logados."""
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(_log_background_error)
+        return task
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        self.http.close()
+
+    # ------------------------- payloads -------------------------
+
+    def _text_payload(self, chat_id, text, quoted_message_id=None):
+        payload = {"chatId": chat_id, "text": text, "session": self.session_name}
+        if quoted_message_id:
+            payload["quotedMessageId"] = quoted_message_id
+        return payload
+
+    def _seen_payload(self, chat_id, message_id, participant=None):
+        return {
+            "session": self.session_name,
+            "chatId": chat_id,
+            "messageId": message_id,
+            "participant": participant,
+        }
+
+
+class TypingIndicator:
+    """
+    Mantém "digitando..." ativo durante o trabalho, sem atrasar a resposta.
+
+    Ao entrar, dispara startTyping em background e o renova a cada `refresh` segundos;
+    ao sair (resposta enviada ou erro), cancela a renovação e envia stopTyping.
+    """
+
+    def __init__(self, client: WahaClient, chat_id: str, refresh: float = WAHA_TYPING_REFRESH):
+        self.client = client
+        self.chat_id = chat_id
+        self.refresh = refresh
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._keep_typing())
+        return self
+
+    async def _keep_typing(self):
+        while True:
+            try:
+                await self.client.astart_typing(self.chat_id)
+            except Exception as e:
+                print(f"Falha ao enviar startTyping para {self.chat_id}: {e}", file=sys.stderr)
+            await asyncio.sleep(self.refresh)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        try:
+            await self.client.astop_typing(self.chat_id)
+        except Exception as e:
+            print(f"Falha ao enviar stopTyping para {self.chat_id}: {e}", file=sys.stderr)
+        return False
+
+
+def _json_or_empty(r) -> dict:
+    try:
+        return r.json()
+    except ValueError:
+        return {}
+
+
+def _log_background_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Falha em chamada WAHA em background: {task.exception()}", file=sys.stderr)
+
+
+# Cliente global do processo
+waha = WahaClient()
@@ -0,0 +1,127 @@
+# weather_client.py
+
+import asyncio
+import os
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+
+import httpx
+
+from metrics import metrics
+
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5")
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", "600"))      # condições atuais: 10 min
+FORECAST_TTL = float(os.getenv("FORECAST_TTL", "1800"))   # previsão de 3 em 3h: 30 min
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "10"))
+# A API gratuita devolve no máximo 5 dias em intervalos de 3h (40 entradas)
+FORECAST_MAX_CNT = 40
+
+
+def normalize_city(city: str) -> str:
+    """'  São  Paulo ' e 'sao paulo' viram a mesma chave de cache."""
+    text = unicodedata.normalize("NFKD", city or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+class WeatherClient:
+    """
+    Cliente do OpenWeatherMap com cache TTL e single-flight.
+
+    - Um httpx.AsyncClient por event loop, reaproveitado entre chamadas (pool de conexões).
+    - Respostas bem-sucedidas ficam em cache por cidade normalizada (LRU de `max_entries`).
+    - Chamadas simultâneas para a mesma chave esperam a mesma requisição em andamento.
+    - A previsão é sempre buscada completa (5 dias) e recortada por quem chama.
+
+    Métricas: weather.cache_hits / weather.cache_misses / weather.coalesced e weather.fetch.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = OPENWEATHER_URL,
+                 max_entries: int = WEATHER_CACHE_SIZE, timeout: float = WEATHER_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+            self._clients[loop] = client
+        return client
+
+    def _get_cached(self, key):
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        expires, data = item
+        if time.monotonic() >= expires:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return data
+
+    def _put_cached(self, key, data, ttl: float):
+        self._cache[key] = (time.monotonic() + ttl, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, endpoint: str, params: dict):
+        """Retorna (json, sucesso)."""
+        # chave lida na hora: o server.py chama load_dotenv depois dos imports
+        api_key = self.api_key or os.getenv("OPENWEATHER_API_KEY")
+        with metrics.timed("weather.fetch"):
+            response = await self._client().get(
+                f"/{endpoint}", params={**params, "APPID": api_key, "units": "metric"}
+            )
+        return response.json(), response.is_success
+
+    async def _cached_fetch(self, key, ttl: float, endpoint: str, params: dict) -> dict:
+        data = self._get_cached(key)
+        if data is not None:
+            metrics.incr("weather.cache_hits")
+            return data
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr("weather.coalesced")
+        else:
+            metrics.incr("weather.cache_misses")
+            task = asyncio.ensure_future(self._fetch(endpoint, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: um chamador cancelado não cancela a busca dos demais
+        data, ok = await asyncio.shield(task)
+        if ok and self._get_cached(key) is None:
+            # erros (cidade não encontrada, chave inválida) não entram no cache
+            self._put_cached(key, data, ttl)
+        return data
+
+    async def current(self, city: str) -> dict:
+        """JSON de /weather para a cidade."""
+        return await self._cached_fetch(("weather", normalize_city(city)), WEATHER_TTL,
+                                        "weather", {"q": city})
+
+    async def forecast(self, city: str, days: int = None) -> dict:
+        """JSON de /forecast (5 dias); com `days`, a lista é recortada para days * 8 entradas."""
+        data = await self._cached_fetch(("forecast", normalize_city(city)), FORECAST_TTL,
+                                        "forecast", {"q": city, "cnt": FORECAST_MAX_CNT})
+        if days is None or "list" not in data:
+            return data
+        return {**data, "list": data["list"][:max(days, 0) * 8]}
+
+    async def aclose(self):
+        for client in list(self._clients.values()):
+            await client.aclose()
+        self._clients.clear()
+
+
+weather = WeatherClient()
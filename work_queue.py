@@ -0,0 +1,150 @@
+# work_queue.py
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+from runtime import runtime
+
+
+class ChatWorkQueue:
+    """
+    Fila limitada de eventos do webhook, drenada por workers asyncio.
+
+    - Mensagens do mesmo chat são processadas em ordem, uma por vez.
+    - Chats diferentes são processados em paralelo (até `workers` ao mesmo tempo).
+    - submit() é chamado pelas threads do Flask e retorna False quando a fila está cheia.
+    - Os workers rodam no event loop compartilhado do AppRuntime.
+
+    Coalescência (coalesce_window > 0): mensagens do mesmo chat que chegam dentro da janela
+    viram uma única chamada do handler, com o evento produzido por `merge(eventos)`. Se uma
+    mensagem nova chega enquanto a resposta ainda é gerada, a geração é cancelada e refeita
+    com todas as mensagens juntas. O handler marca event["irreversivel"] = True antes do
+    primeiro efeito colateral (ferramenta que envia ou altera algo, ou o envio da resposta);
+    a partir daí a geração não é mais cancelada.
+
+    Métricas: queue.depth / queue.active_chats (gauges), queue.wait (tempo na fila),
+    queue.processed / queue.rejected / queue.errors / queue.coalesced / queue.cancelled (contadores).
+    """
+
+    def __init__(self, handler, maxsize: int = 100, workers: int = 4,
+                 coalesce_window: float = 0.0, merge=None):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.coalesce_window = coalesce_window
+        self.merge = merge or (lambda events: events[-1])
+        self.loop = None
+        self._pending = {}
+        self._inflight = {}
+        self._last_arrival = {}
+        self._ready = None
+        self._depth = 0
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self.loop is not None:
+                return
+            runtime.run(self._start_workers())
+            self.loop = runtime.loop
+
+    async def _start_workers(self):
+        self._ready = asyncio.Queue()
+        for i in range(self.workers):
+            asyncio.create_task(self._worker(), name=f"chat-worker-{i}")
+
+    def submit(self, chat_id: str, event, timeout: float = 5.0) -> bool:
+        """Enfileira o evento (thread-safe). Retorna False se a fila estiver cheia."""
+        self.start()
+        fut = asyncio.run_coroutine_threadsafe(self._put(chat_id, event), self.loop)
+        return fut.result(timeout)
+
+    async def _put(self, chat_id: str, event) -> bool:
+        if self._depth >= self.maxsize:
+            metrics.incr("queue.rejected")
+            return False
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            # chat ocioso: cria a fila do chat e agenda para um worker
+            pending = self._pending[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        now = time.perf_counter()
+        pending.append((event, now))
+        self._last_arrival[chat_id] = now
+        self._depth += 1
+        self._update_gauges()
+
+        # geração ainda sem efeitos colaterais: cancela para refazer junto com a mensagem nova
+        inflight = self._inflight.get(chat_id)
+        if self.coalesce_window > 0 and inflight is not None and not inflight[1].get("irreversivel"):
+            inflight[0].cancel()
+        return True
+
+    async def _debounce(self, chat_id: str):
+        """Espera até passar coalesce_window sem mensagens novas no chat (no máximo 4 janelas)."""
+        deadline = time.perf_counter() + 4 * self.coalesce_window
+        while True:
+            now = time.perf_counter()
+            wait = min(self._last_arrival.get(chat_id, 0) + self.coalesce_window, deadline) - now
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            pending = self._pending[chat_id]
+            while pending:
+                if self.coalesce_window > 0:
+                    await self._debounce(chat_id)
+                    batch = [pending.popleft() for _ in range(len(pending))]
+                else:
+                    batch = [pending.popleft()]
+                self._depth -= len(batch)
+                self._update_gauges()
+                now = time.perf_counter()
+                for _, enqueued_at in batch:
+                    metrics.observe("queue.wait", now - enqueued_at)
+
+                events = [event for event, _ in batch]
+                if len(events) > 1:
+                    metrics.incr("queue.coalesced", len(events) - 1)
+                event = self.merge(events) if len(events) > 1 else events[0]
+
+                # roda como task separada para poder ser cancelada por mensagens novas
+                task = asyncio.create_task(self.handler(event))
+                self._inflight[chat_id] = (task, event)
+                await asyncio.wait({task})
+                del self._inflight[chat_id]
+
+                if task.cancelled():
+                    # devolve as mensagens para a frente da fila; serão mescladas com as novas
+                    metrics.incr("queue.cancelled")
+                    pending.extendleft(reversed(batch))
+                    self._depth += len(batch)
+                    self._update_gauges()
+                elif task.exception() is not None:
+                    metrics.incr("queue.errors")
+                    print(f"Erro ao processar evento do chat {chat_id}: {task.exception()}")
+                else:
+                    metrics.incr("queue.processed")
+            # fila do chat vazia: libera o chat para o próximo evento
+            del self._pending[chat_id]
+            self._last_arrival.pop(chat_id, None)
+            self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.gauge("queue.depth", self._depth)
+        metrics.gauge("queue.active_chats", len(self._pending))
+
+    def stats(self) -> dict:
+        return {
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "coalesce_window": self.coalesce_window,
+            "depth": self._depth,
+            "active_chats": len(self._pending),
+        }